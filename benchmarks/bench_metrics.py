@@ -0,0 +1,103 @@
+"""
+Measures the overhead of the metrics instrumentation per request and per database statement.
+
+Requests go straight to a minimal ASGI app, with and without ``MetricsMiddleware`` and the in-flight count of
+``instrument_routes``. Statements run ``SELECT 1`` through a session on in-memory aiosqlite, as ``AsyncSession``
+and as ``TimedSession``; the runs are interleaved and the best of each is kept, since the thread hop of aiosqlite
+varies more than the instrumentation costs. The timing ``TimedSession`` adds is also measured on its own.
+
+The total is the overhead of a request that runs three statements, e.g. a lookup, an insert and its commit.
+
+Run from the project root: ``python -m benchmarks.bench_metrics``.
+"""
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.routing import Route
+
+from src.services.metrics import MetricsMiddleware, TimedSession, count_in_progress, observe_query
+
+NUMBER = 50000
+STATEMENTS = 5000
+ROUNDS = 10
+STATEMENTS_PER_REQUEST = 3
+
+
+def endpoint(request):
+    pass
+
+
+async def handler(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+class App:
+    routes = [Route("/api/contacts/{contact_id}", endpoint)]
+
+    def __init__(self, route_app=handler):
+        self.route_app = route_app
+
+    async def __call__(self, scope, receive, send):
+        # what the router does for a matched route
+        scope["endpoint"] = endpoint
+        await self.route_app(scope, receive, send)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def per_request(app) -> float:
+    start = time.perf_counter()
+    for i in range(NUMBER):
+        scope = {"type": "http", "method": "GET", "path": f"/api/contacts/{i}", "app": App}
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / NUMBER * 1e6
+
+
+async def per_statement(session_class, engine) -> float:
+    statement = text("SELECT 1")
+    async with session_class(engine) as db:
+        start = time.perf_counter()
+        for _ in range(STATEMENTS):
+            await db.execute(statement)
+        return (time.perf_counter() - start) / STATEMENTS * 1e6
+
+
+def timing_only() -> float:
+    statement_type = type(text("SELECT 1"))
+    start = time.perf_counter()
+    for _ in range(NUMBER):
+        begin = time.perf_counter()
+        observe_query(statement_type, time.perf_counter() - begin)
+    return (time.perf_counter() - start) / NUMBER * 1e6
+
+
+async def main() -> None:
+    bare = await per_request(App())
+    measured = await per_request(MetricsMiddleware(App(count_in_progress(handler, "/api/contacts/{contact_id}"))))
+    request = measured - bare
+    print(f"request    bare={bare:7.2f} us  instrumented={measured:7.2f} us  overhead={request:5.2f} us")
+
+    engine = create_async_engine("sqlite+aiosqlite://")
+    bare, measured = float("inf"), float("inf")
+    for _ in range(ROUNDS):
+        bare = min(bare, await per_statement(AsyncSession, engine))
+        measured = min(measured, await per_statement(TimedSession, engine))
+    await engine.dispose()
+    print(f"statement  bare={bare:7.2f} us  instrumented={measured:7.2f} us  overhead={measured - bare:5.2f} us")
+    statement = timing_only()
+    print(f"statement  timing alone={statement:5.2f} us")
+    print(f"request with {STATEMENTS_PER_REQUEST} statements  overhead="
+          f"{request + STATEMENTS_PER_REQUEST * statement:5.2f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Compares sending through the SMTP pool against opening a connection per message.
+
+Messages go to a local aiosmtpd server without TLS, so the numbers leave out the TLS handshake and AUTH
+that the per-message path also pays against a real provider.
+
+Run from the project root: ``python -m benchmarks.bench_smtp``.
+"""
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtplib import SMTP
+
+from src.services.email import SMTPPool
+
+HOST = "127.0.0.1"
+PORT = 8025
+MESSAGES = 500
+CONCURRENCY = 4
+
+
+class Sink:
+    async def handle_DATA(self, server, session, envelope):
+        return "250 OK"
+
+
+def make_message(i: int) -> str:
+    return f"From: sender@example.com\r\nTo: user{i}@example.com\r\nSubject: Message {i}\r\n\r\nHello\r\n"
+
+
+async def per_message(i: int) -> None:
+    smtp = SMTP(hostname=HOST, port=PORT)
+    await smtp.connect()
+    await smtp.sendmail("sender@example.com", [f"user{i}@example.com"], make_message(i))
+    await smtp.quit()
+
+
+async def run(name: str, send) -> None:
+    slots = asyncio.Semaphore(CONCURRENCY)
+
+    async def task(i: int) -> None:
+        async with slots:
+            await send(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(task(i) for i in range(MESSAGES)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {MESSAGES / elapsed:8.1f} messages/s")
+
+
+async def main() -> None:
+    pool = SMTPPool(HOST, PORT, use_tls=False, size=CONCURRENCY)
+
+    async def pooled(i: int) -> None:
+        async with pool.connection() as smtp:
+            await smtp.sendmail("sender@example.com", [f"user{i}@example.com"], make_message(i))
+
+    await run("per-message", per_message)
+    await run("pool", pooled)
+    await pool.close()
+    print(f"pool opened {pool.connections} connections")
+
+
+if __name__ == "__main__":
+    controller = Controller(Sink(), hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        asyncio.run(main())
+    finally:
+        controller.stop()
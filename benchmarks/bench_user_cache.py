@@ -0,0 +1,40 @@
+"""
+Compares the cached user record against the old ``pickle.dumps(user)`` path.
+
+Run from the project root: ``python -m benchmarks.bench_user_cache``.
+"""
+import pickle
+import timeit
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, User
+from src.services.cache import encode_user, decode_user
+
+NUMBER = 20000
+
+
+def load_user() -> User:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as db:
+        db.add(User(username="benchmark", email="benchmark@example.com", password="$2b$12$" + "x" * 53,
+                    created_at=datetime.now(), confirmed=True,
+                    avatar="https://www.gravatar.com/avatar/00000000000000000000000000000000"))
+        db.commit()
+        return db.query(User).first()
+
+
+def report(name: str, encode, decode, user: User) -> None:
+    blob = encode(user)
+    encode_us = timeit.timeit(lambda: encode(user), number=NUMBER) / NUMBER * 1e6
+    decode_us = timeit.timeit(lambda: decode(blob), number=NUMBER) / NUMBER * 1e6
+    print(f"{name:<8} size={len(blob):>5} B  encode={encode_us:7.2f} us  decode={decode_us:7.2f} us")
+
+
+if __name__ == "__main__":
+    user = load_user()
+    report("pickle", pickle.dumps, pickle.loads, user)
+    report("record", encode_user, decode_user, user)
@@ -1,41 +1,113 @@
-from fastapi import FastAPI, Depends
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import uvicorn
-import redis.asyncio as redis
 
-from src.routes import contacts, auth, users
+from src.routes import contacts, auth, users, batch
 from src.conf.config import settings
+from src.services.executor import cpu_executor
+from src.services.cache import user_cache, contacts_cache
+from src.services.auth import auth_service
+from src.services.avatar import UploadSizeLimitMiddleware, MULTIPART_OVERHEAD
+from src.services.email import smtp_pool
+from src.services.metrics import MetricsMiddleware, instrument_routes
+from src.services.rate_limit import RateLimitMiddleware, rate_limiter
+from src.services.redis_pool import create_redis, connect_services
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the shared Redis connection pool and starts the CPU executor and the user cache
+    invalidation listener. Stops them and closes the SMTP and Redis connections on shutdown.
+
+    :param app: The application.
+    :type app: FastAPI
+    """
+    cpu_executor.start()
+    r = create_redis()
+    connect_services(r)
+    app.state.redis = r
+    listener = asyncio.create_task(user_cache.listen())
+    yield
+    listener.cancel()
+    await smtp_pool.close()
+    await r.aclose(close_connection_pool=True)
+    cpu_executor.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["http://localhost:3000"]
 
+# added before CORS, so rejected requests get CORS headers too
+app.add_middleware(UploadSizeLimitMiddleware,
+                   limits={"/api/users/avatar": settings.avatar_max_bytes + MULTIPART_OVERHEAD})
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset",
+                    "Retry-After"],
 )
+# outermost, so request latency includes the other middleware
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, prefix="/api")
 app.include_router(contacts.router, prefix="/api")
 app.include_router(users.router, prefix='/api')
+app.include_router(batch.router, prefix="/api")
 
-
-@app.on_event("startup")
-async def startup() -> None:
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port,
-                          db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
+if settings.avatar_storage == "local":
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name="avatars")
 
 
-@app.get("/", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@app.get("/")
 def read_root() -> dict:
     return {"Hello": "World"}
 
 
+@app.get("/api/health")
+async def health() -> dict:
+    """
+    Returns the state of the CPU executor (running jobs, queue depth and wait time), cache hit counters,
+    SMTP pool counters and how often rate limit checks were served by a local reservation.
+
+    :return: Dict with executor, cache, SMTP pool and rate limit stats.
+    :rtype: dict
+    """
+    return {
+        "cpu_executor": cpu_executor.stats(),
+        "user_cache": user_cache.local.stats(),
+        "user_redis_cache": user_cache.redis_stats(),
+        "token_cache": auth_service.token_cache_stats(),
+        "contacts_cache": contacts_cache.stats(),
+        "smtp_pool": smtp_pool.stats(),
+        "rate_limit_reservations": rate_limiter.local.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """
+    Prometheus metrics of this process.
+
+    :return: The metrics in the Prometheus text format.
+    :rtype: Response
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# after all routes are added
+instrument_routes(app.routes)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,39 @@
+"""Contacts indexes
+
+Revision ID: 3f9c2a71d4b8
+Revises: e63b4b452019
+Create Date: 2026-10-17 10:12:41.208317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a71d4b8'
+down_revision: Union[str, None] = 'e63b4b452019'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_contacts_user_id_id': ['user_id', 'id'],
+    'ix_contacts_user_id_name': ['user_id', 'name'],
+    'ix_contacts_user_id_surname': ['user_id', 'surname'],
+    'ix_contacts_user_id_email': ['user_id', 'email'],
+}
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'contacts', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='contacts', postgresql_concurrently=True, if_exists=True)
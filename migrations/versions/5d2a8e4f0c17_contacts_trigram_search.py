@@ -0,0 +1,39 @@
+"""Contacts trigram search
+
+Revision ID: 5d2a8e4f0c17
+Revises: b71e05c9a2d3
+Create Date: 2026-10-17 14:05:51.330964
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a8e4f0c17'
+down_revision: Union[str, None] = 'b71e05c9a2d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ['name', 'surname', 'email', 'phone']
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # lets user_id share the GIN index with the trigram column
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(f'ix_contacts_user_id_{column}_trgm', 'contacts', ['user_id', column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.drop_index(f'ix_contacts_user_id_{column}_trgm', table_name='contacts', postgresql_concurrently=True,
+                          if_exists=True)
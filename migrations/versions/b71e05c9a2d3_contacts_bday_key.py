@@ -0,0 +1,34 @@
+"""Contacts birthday key
+
+Revision ID: b71e05c9a2d3
+Revises: 3f9c2a71d4b8
+Create Date: 2026-10-17 11:40:03.517092
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e05c9a2d3'
+down_revision: Union[str, None] = '3f9c2a71d4b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('bday_key', sa.SmallInteger(), nullable=True))
+    op.execute("UPDATE contacts SET bday_key = EXTRACT(MONTH FROM born_date) * 100 + EXTRACT(DAY FROM born_date)")
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_bday_key', 'contacts', ['user_id', 'bday_key'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_bday_key', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+    op.drop_column('contacts', 'bday_key')
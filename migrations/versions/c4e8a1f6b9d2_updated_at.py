@@ -0,0 +1,35 @@
+"""Contacts and users updated_at
+
+Revision ID: c4e8a1f6b9d2
+Revises: 5d2a8e4f0c17
+Create Date: 2026-10-17 15:12:08.417352
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f6b9d2'
+down_revision: Union[str, None] = '5d2a8e4f0c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts', postgresql_concurrently=True,
+                      if_exists=True)
+    op.drop_column('users', 'updated_at')
+    op.drop_column('contacts', 'updated_at')
@@ -0,0 +1,26 @@
+"""Drop users.refresh_token, refresh-token sessions live in Redis
+
+Revision ID: e1b7d3a9c5f4
+Revises: c4e8a1f6b9d2
+Create Date: 2026-10-17 18:41:27.903115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b7d3a9c5f4'
+down_revision: Union[str, None] = 'c4e8a1f6b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_column('users', 'refresh_token')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('refresh_token', sa.String(length=255), nullable=True))
@@ -10,11 +10,60 @@ class Settings(BaseSettings):
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    smtp_pool_size: int = 4
+    smtp_keepalive: int = 60
+    smtp_timeout: int = 10
+    outbox_batch_size: int = 50
+    outbox_max_attempts: int = 5
+    outbox_retry_base: int = 30
+    outbox_retry_max: int = 3600
+    outbox_claim_idle: int = 300
+    outbox_max_len: int = 100000
     redis_host: str
     redis_port: int = "6380"
+    redis_pool_size: int = 50
+    redis_pool_timeout: int = 5
+    redis_socket_timeout: int = 5
+    redis_connect_timeout: int = 2
+    redis_health_check_interval: int = 30
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    cpu_pool_size: int = 4
+    cpu_pool_max_queue: int = 64
+    user_cache_ttl: int = 900
+    user_l1_size: int = 10000
+    user_l1_ttl: int = 60
+    token_cache_size: int = 10000
+    token_negative_ttl: int = 30
+    refresh_token_ttl: int = 7 * 24 * 3600
+    login_ip_limit: int = 20
+    login_ip_window: int = 60
+    login_account_limit: int = 10
+    login_account_window: int = 900
+    # capacity and seconds to refill the whole bucket of each route group, see src.services.rate_limit
+    rate_limits: dict[str, tuple[int, int]] = {
+        "auth": (30, 60),
+        "contacts": (300, 60),
+        "users": (60, 60),
+        "batch": (30, 60),
+        "default": (60, 60),
+    }
+    rate_limit_reserve: int = 10
+    rate_limit_reserve_ttl: float = 1.0
+    rate_limit_local_size: int = 10000
+    import_chunk_size: int = 1000
+    import_max_errors: int = 1000
+    export_batch_size: int = 500
+    response_cache_ttl: int = 300
+    batch_max_size: int = 1000
+    batch_max_requests: int = 20
+    avatar_storage: str = "cloudinary"
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_local_dir: str = "static/avatars"
+    avatar_local_url: str = "/static/avatars"
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
     # class Config:
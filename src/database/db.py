@@ -1,17 +1,69 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import Depends, Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from src.conf.config import settings
+from src.services.metrics import TimedQueuePool, TimedSession, instrument_engine
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Converts a synchronous database URL to the matching async driver URL.
+
+    Alembic keeps using the synchronous URL, the application works through asyncpg or aiosqlite.
+
+    :param url: The database URL from the settings.
+    :type url: str
+    :return: The database URL with an async driver.
+    :rtype: str
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+
+# session info key of cache and index changes waiting for the outer transaction of an atomic batch
+PENDING_AFTER_COMMIT = "pending_after_commit"
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+# SQLite keeps the pool its dialect needs, other databases get the default queue pool with checkout timing
+engine = create_async_engine(ASYNC_DATABASE_URL, **({} if make_url(ASYNC_DATABASE_URL).get_backend_name() == "sqlite"
+                                                    else {"poolclass": TimedQueuePool}))
+instrument_engine(engine.sync_engine)
+
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, class_=TimedSession)
+
+
+def get_engine():
+    """
+    Returns the engine, for handlers that manage a connection and its transaction themselves.
+    """
+    return engine
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_session_factory():
+    """
+    Returns the session factory, for handlers that open their own sessions, e.g. to stream a response
+    after the request-scoped session is closed.
+    """
+    return SessionLocal
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db(request: Request, session_factory=Depends(get_session_factory)):
+    """
+    Yields the request-scoped database session. Sub-requests of a batch share the session of the batch.
+    """
+    batch = request.scope.get("batch")
+    if batch is not None:
+        yield batch["db"]
+        return
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close()
@@ -1,13 +1,45 @@
-from sqlalchemy import String, DateTime, ForeignKey, Boolean
+from sqlalchemy import String, DateTime, ForeignKey, Boolean, Index, SmallInteger
 from sqlalchemy.orm import declarative_base, mapped_column, Mapped, relationship
-from datetime import datetime
+from datetime import date, datetime
 
 
 Base = declarative_base()
 
 
+def birthday_key(born_date: date) -> int:
+    """
+    Month and day of a date packed as ``MMDD``, so birthdays sort in calendar order regardless of leap years.
+
+    :param born_date: The date of birth.
+    :type born_date: date
+    :return: The birthday key.
+    :rtype: int
+    """
+    return born_date.month * 100 + born_date.day
+
+
+def default_birthday_key(context) -> int | None:
+    """
+    Column default filling ``bday_key`` from the ``born_date`` of the inserted row.
+    """
+    born_date = context.get_current_parameters().get("born_date")
+    return birthday_key(born_date) if born_date else None
+
+
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        Index("ix_contacts_user_id_name", "user_id", "name"),
+        Index("ix_contacts_user_id_surname", "user_id", "surname"),
+        Index("ix_contacts_user_id_email", "user_id", "email"),
+        Index("ix_contacts_user_id_bday_key", "user_id", "bday_key"),
+        Index("ix_contacts_user_id_updated_at", "user_id", "updated_at"),
+        # trigram search, needs the pg_trgm and btree_gin extensions
+        *(Index(f"ix_contacts_user_id_{column}_trgm", "user_id", column, postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+          for column in ("name", "surname", "email", "phone")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[String] = mapped_column(String(20))
@@ -15,6 +47,8 @@ class Contact(Base):
     email: Mapped[String] = mapped_column(String(40))
     phone: Mapped[String] = mapped_column(String(30))
     born_date: Mapped[datetime] = mapped_column(DateTime)
+    bday_key: Mapped[int] = mapped_column(SmallInteger, default=default_birthday_key)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
     user_id: Mapped[int] = mapped_column("user_id", ForeignKey("users.id", ondelete="CASCADE"),
                                          default=None)
     user = relationship("User", backref="contacts")
@@ -27,6 +61,6 @@ class User(Base):
     email: Mapped[String] = mapped_column(String(100), nullable=False, unique=True)
     password: Mapped[String] = mapped_column(String(100), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
-    refresh_token: Mapped[String] = mapped_column(String(255), nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     avatar: Mapped[String] = mapped_column(String(255), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -1,18 +1,117 @@
-from typing import List
+import base64
+import json
+from typing import List, AsyncIterator
 
-from sqlalchemy import func, or_, and_
-from sqlalchemy.orm import Session
-from datetime import date, timedelta
+from sqlalchemy import or_, and_, select, insert, update, delete, func, case
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.database.models import Contact, User, birthday_key
+from src.schemas import ContactModel, ContactPatch
+from src.conf.config import settings
+from src.database.db import PENDING_AFTER_COMMIT
+from src.services.suggest import contact_suggest
+from src.services.cache import contacts_cache
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: Session, name: str = None, surname: str = None,
-                       email: str = None) -> List[Contact]:
+SEARCH_COLUMNS = (Contact.name, Contact.surname, Contact.email, Contact.phone)
+
+
+def encode_cursor(contact: Contact) -> str:
+    """
+    Builds an opaque pagination cursor pointing right after the given contact.
+
+    :param contact: The last contact of the current page.
+    :type contact: Contact
+    :return: The cursor for the next page.
+    :rtype: str
+    """
+    raw = json.dumps({"id": contact.id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decodes a pagination cursor built by :func:`encode_cursor`.
+
+    :param cursor: The cursor received from the client.
+    :type cursor: str
+    :return: The ID of the last contact of the previous page.
+    :rtype: int
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    return last_id
+
+
+def search_contacts(q: str, dialect: str) -> tuple:
+    """
+    Builds a case-insensitive prefix and fuzzy search over name, surname, email and phone.
+
+    On PostgreSQL the predicates are served by the pg_trgm GIN indexes and results are ranked by similarity.
+    Other databases fall back to prefix and substring matching, with prefix matches first.
+
+    :param q: The search string.
+    :type q: str
+    :param dialect: The name of the database dialect.
+    :type dialect: str
+    :return: The search predicate and the ORDER BY clauses ranking the results.
+    :rtype: tuple
+    """
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    prefix = [column.ilike(f"{escaped}%", escape="\\") for column in SEARCH_COLUMNS]
+    if dialect == "postgresql":
+        fuzzy = [column.op("%")(q) for column in SEARCH_COLUMNS]
+        rank = func.greatest(*[func.similarity(column, q) for column in SEARCH_COLUMNS])
+        return or_(*prefix, *fuzzy), (rank.desc(), Contact.id)
+    fuzzy = [column.ilike(f"%{escaped}%", escape="\\") for column in SEARCH_COLUMNS]
+    return or_(*fuzzy), (case((or_(*prefix), 0), else_=1), Contact.id)
+
+
+def filter_contacts(stmt: Select, user: User, name: str = None, surname: str = None, email: str = None) -> Select:
+    """
+    Restricts a query to the contacts of a user matching all given fields.
+
+    :param stmt: The query to filter.
+    :type stmt: Select
+    :param user: The owner of the contacts.
+    :type user: User
+    :param name: The name of the contact.
+    :type name: str, optional
+    :param surname: The surname of the contact.
+    :type surname: str, optional
+    :param email: The email of the contact.
+    :type email: str, optional
+    :return: The filtered query.
+    :rtype: Select
+    """
+    stmt = stmt.filter(Contact.user_id == user.id)
+    if name:
+        stmt = stmt.filter(Contact.name == name)
+    if surname:
+        stmt = stmt.filter(Contact.surname == surname)
+    if email:
+        stmt = stmt.filter(Contact.email == email)
+    return stmt
+
+
+async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession, name: str = None, surname: str = None,
+                       email: str = None, cursor: str = None, q: str = None) -> List[Contact]:
     """
     Retrieves a list of contacts for a specific user with specified pagination parameters.
 
+    Filters are combined. Contacts are ordered by ID, or by relevance when searching with ``q``.
+    With a cursor the page is found with an ``id > last_id`` seek predicate, so every page costs the same;
+    ``skip`` is kept for backward compatibility and for search results.
+
     :param skip: The number of contacts to skip.
     :type skip: int
     :param limit: The maximum number of contacts to return.
@@ -20,27 +119,83 @@ async def get_contacts(skip: int, limit: int, user: User, db: Session, name: str
     :param user: The user to retrieve contacts for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :param name: The name of the contact to retrieve.
     :type name: str, optional
     :param surname: The surname of the contact to retrieve.
     :type surname: str, optional
     :param email: The email of the contact to retrieve.
     :type email: str, optional
+    :param cursor: The cursor returned with the previous page. Ignored when searching.
+    :type cursor: str, optional
+    :param q: Search string matched against name, surname, email and phone.
+    :type q: str, optional
     :return: A list of contacts.
     :rtype: List[Contact]
+    :raises ValueError: If the cursor is malformed.
     """
-    if name:
-        return db.query(Contact).filter(and_(Contact.name == name, Contact.user_id == user.id)).all()
-    if surname:
-        return db.query(Contact).filter(and_(Contact.surname == surname, Contact.user_id == user.id)).all()
-    if email:
-        return db.query(Contact).filter(and_(Contact.email == email, Contact.user_id == user.id)).all()
+    stmt = filter_contacts(select(Contact), user, name, surname, email)
+    if q:
+        where, order_by = search_contacts(q, db.get_bind().dialect.name)
+        stmt = stmt.filter(where).order_by(*order_by).offset(skip)
+    elif cursor:
+        stmt = stmt.filter(Contact.id > decode_cursor(cursor)).order_by(Contact.id)
     else:
-        return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+        stmt = stmt.order_by(Contact.id).offset(skip)
+    result = await db.execute(stmt.limit(limit))
+    return result.scalars().all()
+
 
+async def get_contacts_version(user: User, db: AsyncSession, name: str = None, surname: str = None,
+                               email: str = None, q: str = None) -> tuple:
+    """
+    Retrieves the latest update time and the number of the contacts matching the filters, to build a list ETag
+    without loading the contacts.
 
-async def get_contact(contact_id: int, user: User, db: Session) -> Contact:
+    :param user: The user to retrieve contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param name: The name of the contact.
+    :type name: str, optional
+    :param surname: The surname of the contact.
+    :type surname: str, optional
+    :param email: The email of the contact.
+    :type email: str, optional
+    :param q: Search string matched against name, surname, email and phone.
+    :type q: str, optional
+    :return: The latest ``updated_at`` (None if there are no contacts) and the number of contacts.
+    :rtype: tuple
+    """
+    stmt = filter_contacts(select(func.max(Contact.updated_at), func.count(Contact.id)), user, name, surname, email)
+    if q:
+        stmt = stmt.filter(search_contacts(q, db.get_bind().dialect.name)[0])
+    result = await db.execute(stmt)
+    return tuple(result.one())
+
+
+async def stream_contacts(user: User, db: AsyncSession) -> AsyncIterator[Row]:
+    """
+    Streams all contacts of a specific user through a server-side cursor, ``export_batch_size`` rows at a time.
+
+    Rows hold only the contact fields, so no ORM objects are built.
+
+    :param user: The user to retrieve contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Async iterator of rows with name, surname, email, phone and born_date.
+    :rtype: AsyncIterator[Row]
+    """
+    stmt = (select(Contact.name, Contact.surname, Contact.email, Contact.phone, Contact.born_date)
+            .filter(Contact.user_id == user.id).order_by(Contact.id)
+            .execution_options(yield_per=settings.export_batch_size))
+    result = await db.stream(stmt)
+    async for row in result:
+        yield row
+
+
+async def get_contact(contact_id: int, user: User, db: AsyncSession) -> Contact:
     """
     Retrieves a single contact with the specified ID for a specific user.
 
@@ -49,37 +204,88 @@ async def get_contact(contact_id: int, user: User, db: Session) -> Contact:
     :param user: The user to retrieve the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Contact | None
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+    result = await db.execute(stmt)
+    return result.scalars().first()
 
 
-async def create_contact(body: ContactModel, user: User, db: Session) -> Contact:
+async def contacts_changed(db: AsyncSession, user_id: int, operation, *args) -> None:
     """
-    Creates a new contact for a specific user.
+    Invalidates the cached contact responses of a user and applies a change to the autocomplete index once it
+    is committed.
+
+    Inside an atomic batch the commit only releases a savepoint. The index change waits in the session until the
+    whole batch commits, and the responses are invalidated again then, since a concurrent request may have
+    cached the state from before the batch under the new generation in the meantime.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user_id: The ID of the user whose contacts changed.
+    :type user_id: int
+    :param operation: The method of ``contact_suggest`` to call.
+    :param args: The arguments of the method.
+    :return: None.
+    :rtype: None
+    """
+    await contacts_cache.bump(user_id)
+    pending = db.info.get(PENDING_AFTER_COMMIT)
+    if pending is None:
+        await operation(*args)
+    else:
+        pending.extend([(contacts_cache.bump, (user_id,)), (operation, args)])
+
+
+async def create_contact(body: ContactModel, user: User, db: AsyncSession) -> Contact:
+    """
+    Creates a new contact for a specific user with a single INSERT ... RETURNING.
 
     :param body: The data for the contact to create.
     :type body: ContactModel
     :param user: The user to create the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The newly created contact.
     :rtype: Contact
     """
-    user = Contact(name=body.name, surname=body.surname, email=body.email, phone=body.phone, born_date=body.born_date,
-                   user_id=user.id)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    stmt = insert(Contact).values(**body.model_dump(), user_id=user.id).returning(Contact)
+    result = await db.execute(stmt)
+    user = result.scalar_one()
+    await db.commit()
+    await contacts_changed(db, user.user_id, contact_suggest.add, user)
     return user
 
 
-async def update_contact(contact_id: int, body: ContactModel, user: User, db: Session) -> Contact | None:
+async def create_contacts(bodies: List[ContactModel], user: User, db: AsyncSession) -> int:
+    """
+    Creates many contacts for a specific user with one batched INSERT and one commit.
+
+    :param bodies: The data for the contacts to create.
+    :type bodies: List[ContactModel]
+    :param user: The user to create the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of created contacts.
+    :rtype: int
+    """
+    if not bodies:
+        return 0
+    stmt = insert(Contact).returning(Contact.id, Contact.name, Contact.surname, Contact.user_id)
+    result = await db.execute(stmt, [dict(body.model_dump(), user_id=user.id) for body in bodies])
+    created = result.all()
+    await db.commit()
+    await contacts_changed(db, user.id, contact_suggest.add_many, user.id, created)
+    return len(created)
+
+
+async def update_contact(contact_id: int, body: ContactModel, user: User, db: AsyncSession) -> Contact | None:
     """
-    Updates a single contact with the specified ID for a specific user.
+    Updates a single contact with the specified ID for a specific user with a single UPDATE ... RETURNING.
 
     :param contact_id: The ID of the contact to update.
     :type contact_id: int
@@ -88,61 +294,126 @@ async def update_contact(contact_id: int, body: ContactModel, user: User, db: Se
     :param user: The user to update the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated contact, or None if it does not exist.
     :rtype: Contact | None
     """
-    user = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    # updated_at is set explicitly, so a copy of the contact already in the session is synchronized too
+    stmt = (update(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(**body.model_dump(), bday_key=birthday_key(body.born_date), updated_at=datetime.now())
+            .returning(Contact))
+    result = await db.execute(stmt)
+    user = result.scalar_one_or_none()
+    await db.commit()
     if user:
-        user.name = body.name
-        user.surname = body.surname
-        user.email = body.email
-        user.phone = body.phone
-        user.born_date = body.born_date
-        db.commit()
+        await contacts_changed(db, user.user_id, contact_suggest.add, user)
     return user
 
 
-async def remove_contact(contact_id: int, user: User, db: Session) -> Contact | None:
+async def remove_contact(contact_id: int, user: User, db: AsyncSession) -> Contact | None:
     """
-    Removes a single contact with the specified ID for a specific user.
+    Removes a single contact with the specified ID for a specific user with a single DELETE ... RETURNING.
 
     :param contact_id: The ID of the contact to remove.
     :type contact_id: int
     :param user: The user to remove the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The removed contact, or None if it does not exist.
     :rtype: Contact | None
     """
-    user = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = delete(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+    result = await db.execute(stmt)
+    user = result.scalar_one_or_none()
+    await db.commit()
     if user:
-        db.delete(user)
-        db.commit()
+        await contacts_changed(db, user.user_id, contact_suggest.remove, user)
     return user
 
 
-async def get_contacts_bdays(user: User, db: Session) -> List[Contact]:
+async def update_contacts(patches: List[ContactPatch], user: User, db: AsyncSession) -> List[int]:
     """
-    Retrieves a list of contacts for a specific user with birthday in next 7 days.
+    Applies partial updates to many contacts of a specific user in one transaction.
+
+    Ownership is checked with one SELECT, then all updates are sent as one executemany UPDATE by primary key.
+
+    :param patches: The IDs of the contacts with the fields to change; None fields are left as they are.
+        A later patch of the same ID wins.
+    :type patches: List[ContactPatch]
+    :param user: The user to update the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the updated contacts.
+    :rtype: List[int]
+    """
+    changes = {patch.id: patch.model_dump(exclude_none=True) for patch in patches}
+    stmt = select(Contact.id, Contact.name, Contact.surname, Contact.user_id).filter(
+        Contact.user_id == user.id, Contact.id.in_(changes))
+    owned = (await db.execute(stmt)).all()
+    if not owned:
+        return []
+    now = datetime.now()
+    rows = []
+    for contact in owned:
+        values = dict(changes[contact.id], updated_at=now)
+        if values.get("born_date"):
+            values["bday_key"] = birthday_key(values["born_date"])
+        rows.append(values)
+    await db.execute(update(Contact), rows)
+    await db.commit()
+    renamed = [Contact(**{**contact._asdict(), **{field: changes[contact.id][field] for field in ("name", "surname")
+                                                   if field in changes[contact.id]}})
+               for contact in owned if {"name", "surname"} & changes[contact.id].keys()]
+    await contacts_changed(db, user.id, contact_suggest.add_many, user.id, renamed)
+    return [contact.id for contact in owned]
+
+
+async def remove_contacts(contact_ids: List[int], user: User, db: AsyncSession) -> List[int]:
+    """
+    Removes many contacts of a specific user with a single DELETE ... RETURNING.
+
+    :param contact_ids: The IDs of the contacts to remove.
+    :type contact_ids: List[int]
+    :param user: The user to remove the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the removed contacts.
+    :rtype: List[int]
+    """
+    stmt = delete(Contact).filter(Contact.user_id == user.id, Contact.id.in_(contact_ids)).returning(Contact.id)
+    removed = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    if removed:
+        await contacts_changed(db, user.id, contact_suggest.remove_many, user.id, removed)
+    return removed
+
+
+async def get_contacts_bdays(user: User, db: AsyncSession, days: int = 7) -> List[Contact]:
+    """
+    Retrieves a list of contacts for a specific user with birthday in the next ``days`` days.
+
+    Uses the indexed ``bday_key`` column; a window crossing New Year is split into two ranges.
 
     :param user: The user to retrieve contacts for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param days: The number of days to look ahead.
+    :type days: int
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    dateFrom = date.today()
-    dateTo = date.today() + timedelta(days=7)
-    thisYear = dateFrom.year
-    nextYear = dateFrom.year + 1
-    return (db.query(Contact).filter(
-        and_(or_(
-            func.to_date(func.concat(func.to_char(Contact.born_date, "DDMM"), thisYear), "DDMMYYYY").between(dateFrom,
-                                                                                                        dateTo),
-            func.to_date(func.concat(func.to_char(Contact.born_date, "DDMM"), nextYear), "DDMMYYYY").between(dateFrom,
-                                                                                                        dateTo)),
-        Contact.user_id == user.id))
-            .all())
+    date_from = date.today()
+    key_from = birthday_key(date_from)
+    key_to = birthday_key(date_from + timedelta(days=days))
+    stmt = select(Contact).filter(Contact.user_id == user.id)
+    if days < 365:
+        if key_from <= key_to:
+            stmt = stmt.filter(Contact.bday_key.between(key_from, key_to))
+        else:
+            stmt = stmt.filter(or_(Contact.bday_key >= key_from, Contact.bday_key <= key_to))
+    result = await db.execute(stmt)
+    return result.scalars().all()
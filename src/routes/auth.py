@@ -1,19 +1,45 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis
 
 from src.schemas import UserResponse, UserModel, TokenModel, RequestEmail
 from src.database.db import get_db
+from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.login_guard import login_guard
+from src.services.outbox import email_outbox
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
 
 
+async def queue_email(background_tasks: BackgroundTasks, email: str, username: str, host: str) -> None:
+    """
+    Queues a verification email in the outbox, or sends it from this process if Redis is unavailable.
+
+    :param background_tasks: Background tasks.
+    :type background_tasks: BackgroundTasks
+    :param email: Email address to send message.
+    :type email: str
+    :param username: Username of the recipient.
+    :type username: str
+    :param host: Hostname of the recipient.
+    :type host: str
+    :return: None.
+    :rtype: None
+    """
+    try:
+        await email_outbox.enqueue(email, username, host)
+    except redis.RedisError as err:
+        print(err)
+        background_tasks.add_task(send_email, email, username, host)
+
+
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Sign up a new user.
 
@@ -24,78 +50,97 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     :param request: Request object.
     :type request: Request
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Dict with user details and message.
     :rtype: Dict
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    await queue_email(background_tasks, new_user.email, new_user.username, str(request.base_url))
     return {"user": new_user, "detail": "User created successfully"}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
-    Login user.
+    Login user. Clients with too many recent attempts get 429 before the user lookup and the password check.
 
+    :param request: The request.
+    :type request: Request
     :param body: Data of the user to login.
     :type body: OAuth2PasswordRequestForm
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Return dict with access token and refresh token
     :rtype: Dict
     """
+    await login_guard.check(request.client.host if request.client else "unknown", body.username)
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    await login_guard.reset(user.email)
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, access_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
-    Refresh access token.
+    Refresh access token. The refresh token is exchanged for a new one of the same session.
 
     :param credentials: Authorization credentials.
     :type credentials: HTTPAuthorizationCredentials
-    :param db: The database session.
-    :type db: Session
     :return: Return dict with access token and refresh token
     :rtype: dict
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
+    email, refresh_token = await auth_service.rotate_refresh_token(credentials.credentials)
     access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    End the session of a refresh token.
+
+    :param credentials: Authorization credentials with the refresh token.
+    :type credentials: HTTPAuthorizationCredentials
+    :return: None.
+    :rtype: None
+    """
+    await auth_service.revoke_refresh_token(credentials.credentials)
+
+
+@router.post('/logout_all', status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    End every session of the current user. Access tokens stay valid until they expire.
+
+    :param current_user: The current user.
+    :type current_user: User
+    :return: None.
+    :rtype: None
+    """
+    await auth_service.revoke_all_refresh_tokens(current_user.email)
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     Confirm email verification.
 
     :param token: Token used for verification.
     :type token: str
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Message that email is confirmed.
     :rtype: dict
     """
@@ -111,7 +156,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     Sends an email to confirm email verification.
 
@@ -122,7 +167,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :param request: The request to send the email.
     :type request: Request
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Message.
     :rtype: dict
     """
@@ -131,5 +176,5 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await queue_email(background_tasks, user.email, user.username, str(request.base_url))
     return {"message": "Check your email for confirmation."}
@@ -0,0 +1,61 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Request, status
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.database.db import get_db, get_engine, get_session_factory, PENDING_AFTER_COMMIT
+from src.database.models import User
+from src.schemas import BatchRequest, BatchResult
+from src.services import batch as batch_service
+from src.services.auth import auth_service
+from src.services.cache import contacts_cache
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+
+@router.post("", response_model=List[BatchResult])
+async def run_batch(body: BatchRequest, request: Request, current_user: User = Depends(auth_service.get_current_user),
+                    db: AsyncSession = Depends(get_db), engine: AsyncEngine = Depends(get_engine),
+                    session_factory=Depends(get_session_factory)):
+    """
+    Runs an ordered list of sub-requests against the API and returns all their responses.
+
+    The token is verified and the user is resolved once, and all sub-requests share one database session.
+    With ``atomic`` they also share one transaction: every sub-request commits to a savepoint, and the
+    transaction is rolled back if any of them fails. Changes to the autocomplete index and invalidations of
+    cached users and contact responses are applied after the transaction commits.
+
+    :param body: The sub-requests.
+    :type body: BatchRequest
+    :param request: The batch request.
+    :type request: Request
+    :param current_user: The user to run the sub-requests for.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param engine: The engine to open the connection of an atomic batch on.
+    :type engine: AsyncEngine
+    :param session_factory: Factory of the transaction-bound session for atomic batches.
+    :type session_factory: async_sessionmaker
+    :return: Status, headers and body of every sub-request, in order.
+    :rtype: List[dict]
+    """
+    if current_user in db:
+        # a rollback after a failed sub-request must not expire the user
+        db.expunge(current_user)
+    if not body.atomic:
+        return await batch_service.run_batch(request, body.requests, current_user, db)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        async with session_factory(bind=conn, join_transaction_mode="create_savepoint") as atomic_db:
+            pending = atomic_db.info[PENDING_AFTER_COMMIT] = []
+            results = await batch_service.run_batch(request, body.requests, current_user, atomic_db, atomic=True)
+        if any(result["status"] >= status.HTTP_400_BAD_REQUEST for result in results):
+            await transaction.rollback()
+            # responses cached by earlier sub-requests may contain rolled back changes
+            await contacts_cache.bump(current_user.id)
+            return results
+        await transaction.commit()
+    for operation, args in pending:
+        await operation(*args)
+    return results
@@ -1,30 +1,93 @@
+import csv
+from datetime import date
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_session_factory
 from src.database.models import User
-from src.schemas import ContactModel
+from src.schemas import (ContactModel, ContactImportReport, ContactSuggestion, ContactBatchDelete, ContactBatchUpdate,
+                         ContactBatchResult)
 from src.repository import contacts as repository_contacts
 from src.services.auth import auth_service
+from src.services import contacts_io
+from src.services.suggest import contact_suggest
+from src.services.cache import contacts_cache
+from src.services.etag import make_etag, not_modified
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
+contact_adapter = TypeAdapter(ContactModel)
+contacts_adapter = TypeAdapter(List[ContactModel])
+
+
+def json_response(body: bytes, headers: dict | None = None) -> Response:
+    """
+    Wraps an already serialized JSON body into a response.
+
+    :param body: The serialized body.
+    :type body: bytes
+    :param headers: Response headers.
+    :type headers: dict, optional
+    :return: The response.
+    :rtype: Response
+    """
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Empty response telling the client that its copy with this entity tag is still current.
+
+    :param etag: The entity tag of the resource.
+    :type etag: str
+    :return: The 304 response.
+    :rtype: Response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def cached_response(request: Request, cached: tuple) -> Response:
+    """
+    Answers from a cached response, or with 304 if the client already has it.
+
+    :param request: The request.
+    :type request: Request
+    :param cached: The cached body and headers.
+    :type cached: tuple
+    :return: The response.
+    :rtype: Response
+    """
+    body, headers = cached
+    if not_modified(request, headers.get("ETag")):
+        return not_modified_response(headers["ETag"])
+    return json_response(body, headers)
 
 
 @router.get("/", response_model=List[ContactModel])
-async def read_users(skip: int = 0, limit: int = 50, db: Session = Depends(get_db),
+async def read_users(request: Request, skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(auth_service.get_current_user), name: str | None = None,
-                     surname: str | None = None, email: str | None = None):
+                     surname: str | None = None, email: str | None = None, cursor: str | None = None,
+                     q: str | None = Query(None, min_length=1, max_length=100)):
     """
     Retrieves a list of contacts for a specific user with specified pagination parameters.
 
+    When the page is full, the ``X-Next-Cursor`` header holds the cursor for the next page.
+    Search results with ``q`` are ranked by relevance and paged with ``skip``.
+    Serialized pages are cached per user until the user's contacts change. The ``ETag`` is derived from
+    the latest update time and the number of matching contacts, so ``If-None-Match`` is answered with 304
+    before any contact is loaded.
+
+    :param request: The request.
+    :type request: Request
     :param skip: The number of contacts to skip.
     :type skip: int
     :param limit: The maximum number of contacts to return.
     :type limit: int
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :param current_user: The user to retrieve contacts for.
     :type current_user: User
     :param name: The name of the contact to retrieve.
@@ -33,37 +96,119 @@ async def read_users(skip: int = 0, limit: int = 50, db: Session = Depends(get_d
     :type surname: str, optional
     :param email: The email of the contact to retrieve.
     :type email: str, optional
+    :param cursor: The cursor from the ``X-Next-Cursor`` header of the previous page.
+    :type cursor: str, optional
+    :param q: Case-insensitive prefix and fuzzy search over name, surname, email and phone.
+    :type q: str, optional
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    users = await repository_contacts.get_contacts(skip, limit, current_user, db, name, surname, email)
-    return users
+    key = f"list:{(skip, limit, name, surname, email, cursor, q)!r}"
+    generation, cached = await contacts_cache.get(current_user.id, key)
+    if cached:
+        return cached_response(request, cached)
+    version = await repository_contacts.get_contacts_version(current_user, db, name, surname, email, q)
+    etag = make_etag(key, *version)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    try:
+        users = await repository_contacts.get_contacts(skip, limit, current_user, db, name, surname, email, cursor, q)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {"ETag": etag}
+    if not q and users and len(users) == limit:
+        headers["X-Next-Cursor"] = repository_contacts.encode_cursor(users[-1])
+    body = contacts_adapter.dump_json(contacts_adapter.validate_python(users, from_attributes=True))
+    await contacts_cache.set(current_user.id, generation, key, body, headers)
+    return json_response(body, headers)
+
+
+@router.get("/suggest", response_model=List[ContactSuggestion])
+async def suggest_contacts(prefix: str = Query(min_length=1, max_length=60), limit: int = Query(10, ge=1, le=50),
+                           current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Suggests contacts whose "surname name" starts with a prefix, from the Redis autocomplete index.
+
+    :param prefix: The typed prefix.
+    :type prefix: str
+    :param limit: The maximum number of suggestions.
+    :type limit: int
+    :param current_user: The user to suggest contacts for.
+    :type current_user: User
+    :return: A list of contact ids with labels.
+    :rtype: List[dict]
+    """
+    return await contact_suggest.suggest(current_user.id, prefix, limit)
+
+
+@router.get("/export")
+async def export_contacts(fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|vcard)$"),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          session_factory=Depends(get_session_factory)):
+    """
+    Exports all contacts of a specific user as NDJSON, CSV or vCard.
+
+    Contacts are read through a server-side cursor and streamed in batches, so memory use does not grow
+    with the number of contacts.
+
+    :param fmt: ``ndjson``, ``csv`` or ``vcard``.
+    :type fmt: str
+    :param current_user: The user to export the contacts for.
+    :type current_user: User
+    :param session_factory: Factory of the session that lives as long as the streamed response.
+    :type session_factory: async_sessionmaker
+    :return: Streamed file with contacts.
+    :rtype: StreamingResponse
+    """
+    async def content():
+        async with session_factory() as db:
+            rows = repository_contacts.stream_contacts(current_user, db)
+            async for chunk in contacts_io.export_contacts(rows, fmt):
+                yield chunk
+
+    filename = f"contacts.{contacts_io.EXPORT_EXTENSIONS[fmt]}"
+    return StreamingResponse(content(), media_type=contacts_io.EXPORT_MEDIA_TYPES[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 
 @router.get("/{contact_id}", response_model=ContactModel)
-async def read_user(contact_id: int, current_user: User = Depends(auth_service.get_current_user),
-                    db: Session = Depends(get_db)):
+async def read_user(request: Request, contact_id: int, current_user: User = Depends(auth_service.get_current_user),
+                    db: AsyncSession = Depends(get_db)):
     """
     Retrieves a single contact with the specified ID for a specific user.
 
+    The ``ETag`` is derived from the ID and the update time of the contact.
+
+    :param request: The request.
+    :type request: Request
     :param contact_id: The ID of the contact to retrieve.
     :type contact_id: int
     :param current_user: The user to retrieve the contact for.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Contact | None
     """
+    key = f"contact:{contact_id}"
+    generation, cached = await contacts_cache.get(current_user.id, key)
+    if cached:
+        return cached_response(request, cached)
     user = await repository_contacts.get_contact(contact_id, current_user, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return user
+    etag = make_etag(user.id, user.updated_at)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    headers = {"ETag": etag}
+    body = contact_adapter.dump_json(contact_adapter.validate_python(user, from_attributes=True))
+    await contacts_cache.set(current_user.id, generation, key, body, headers)
+    return json_response(body, headers)
 
 
 @router.post("/", response_model=ContactModel)
 async def create_contact(body: ContactModel, current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+                         db: AsyncSession = Depends(get_db)):
     """
     Creates a new contact for a specific user.
 
@@ -72,16 +217,86 @@ async def create_contact(body: ContactModel, current_user: User = Depends(auth_s
     :param current_user: The user to create the note for.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The newly created contact.
     :rtype: Contact
     """
     return await repository_contacts.create_contact(body, current_user, db)
 
 
+@router.post("/import", response_model=ContactImportReport)
+async def import_contacts(file: UploadFile = File(),
+                          fmt: str | None = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Imports contacts from a CSV or NDJSON file for a specific user.
+
+    Rows are validated and inserted in chunks, invalid rows are reported and skipped.
+
+    :param file: CSV file with a header row or NDJSON file with one contact per line.
+    :type file: UploadFile
+    :param fmt: ``csv`` or ``ndjson``. Detected from the file name or content type by default.
+    :type fmt: str, optional
+    :param current_user: The user to import the contacts for.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of imported and failed rows and the per-row errors.
+    :rtype: dict
+    """
+    fmt = fmt or contacts_io.detect_format(file.filename, file.content_type)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Use a CSV or NDJSON file")
+    try:
+        return await contacts_io.import_contacts(file.file, fmt, current_user, db)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not read the file: {e}")
+
+
+@router.post("/batch-delete", response_model=List[ContactBatchResult])
+async def remove_contacts(body: ContactBatchDelete, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Removes many contacts of a specific user in one transaction.
+
+    :param body: The IDs of the contacts to remove.
+    :type body: ContactBatchDelete
+    :param current_user: The user to remove the contacts for.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: ``deleted`` or ``not_found`` for every requested ID.
+    :rtype: List[dict]
+    """
+    removed = set(await repository_contacts.remove_contacts(body.ids, current_user, db))
+    return [{"id": contact_id, "status": "deleted" if contact_id in removed else "not_found"}
+            for contact_id in dict.fromkeys(body.ids)]
+
+
+@router.patch("/batch", response_model=List[ContactBatchResult])
+async def update_contacts(body: ContactBatchUpdate, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Applies partial updates to many contacts of a specific user in one transaction.
+
+    :param body: The IDs of the contacts with the fields to change.
+    :type body: ContactBatchUpdate
+    :param current_user: The user to update the contacts for.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: ``updated`` or ``not_found`` for every requested ID.
+    :rtype: List[dict]
+    """
+    updated = set(await repository_contacts.update_contacts(body.items, current_user, db))
+    return [{"id": contact_id, "status": "updated" if contact_id in updated else "not_found"}
+            for contact_id in dict.fromkeys(item.id for item in body.items)]
+
+
 @router.put("/{contact_id}", response_model=ContactModel)
 async def update_contact(body: ContactModel, contact_id: int, current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+                         db: AsyncSession = Depends(get_db)):
     """
     Updates a single contact with the specified ID for a specific user.
 
@@ -92,7 +307,7 @@ async def update_contact(body: ContactModel, contact_id: int, current_user: User
     :param current_user: The user to update the contact for.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated contact, or None if it does not exist.
     :rtype: Contact | None
     """
@@ -104,7 +319,7 @@ async def update_contact(body: ContactModel, contact_id: int, current_user: User
 
 @router.delete("/{contact_id}", response_model=ContactModel)
 async def remove_contact(contact_id: int, current_user: User = Depends(auth_service.get_current_user),
-                         db: Session = Depends(get_db)):
+                         db: AsyncSession = Depends(get_db)):
     """
     Removes a single contact with the specified ID for a specific user.
 
@@ -113,7 +328,7 @@ async def remove_contact(contact_id: int, current_user: User = Depends(auth_serv
     :param current_user: The user to remove the contact for.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The removed contact, or None if it does not exist.
     :rtype: Contact | None
     """
@@ -124,16 +339,31 @@ async def remove_contact(contact_id: int, current_user: User = Depends(auth_serv
 
 
 @router.get("/bdays/", response_model=List[ContactModel])
-async def read_bdays(current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+async def read_bdays(request: Request, days: int = Query(7, ge=0, le=366), current_user: User = Depends(auth_service.get_current_user),
+                     db: AsyncSession = Depends(get_db)):
     """
-    Retrieves a list of contacts for a specific user with birthday in next 7 days.
+    Retrieves a list of contacts for a specific user with birthday in the next ``days`` days.
 
+    :param request: The request.
+    :type request: Request
+    :param days: The number of days to look ahead.
+    :type days: int
     :param current_user: The user to retrieve contacts for.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    users = await repository_contacts.get_contacts_bdays(current_user, db)
-    return users
+    key = f"bdays:{date.today()}:{days}"
+    generation, cached = await contacts_cache.get(current_user.id, key)
+    if cached:
+        return cached_response(request, cached)
+    etag = make_etag(key, *await repository_contacts.get_contacts_version(current_user, db))
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    users = await repository_contacts.get_contacts_bdays(current_user, db, days)
+    headers = {"ETag": etag}
+    body = contacts_adapter.dump_json(contacts_adapter.validate_python(users, from_attributes=True))
+    await contacts_cache.set(current_user.id, generation, key, body, headers)
+    return json_response(body, headers)
@@ -1,60 +1,58 @@
-import pickle
-
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
-import redis
+from fastapi import APIRouter, Depends, status, Request, Response, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.conf.config import settings
 from src.schemas import UserDb
+from src.services.etag import make_etag, not_modified
+from src.services.avatar import avatar_service
 
 router = APIRouter(prefix="/users", tags=["users"])
-red = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(request: Request, response: Response,
+                        current_user: User = Depends(auth_service.get_current_user)):
     """
     Return information about the current user.
 
+    The ``ETag`` is derived from the update time of the user, ``If-None-Match`` is answered with 304.
+
+    :param request: The request.
+    :type request: Request
+    :param response: The response to set the ``ETag`` header on.
+    :type response: Response
     :param current_user: Data of the current user.
     :type current_user: User
     :return: Return data about the current user.
     :rtype: User
     """
+    etag = make_etag(current_user.id, current_user.updated_at)
+    if not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return current_user
 
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     Update the avatar of the current user.
 
+    The image is resized to square thumbnails before it is stored, uploads over ``avatar_max_bytes`` are rejected.
+
     :param file: File to be updated with the avatar.
     :type file: UploadFile
     :param current_user: Data of the current user.
     :type current_user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: Data of the updated user.
     :rtype: User
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    src_url = await avatar_service.update(current_user.id, file)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
-    red.delete(f"user:{current_user.email}")
     return user
@@ -1,7 +1,11 @@
+from typing import Any, Dict, List
+
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from datetime import datetime
 
+from src.conf.config import settings
+
 PhoneNumber.phone_format = "E164"
 
 
@@ -13,6 +17,62 @@ class ContactModel(BaseModel):
     born_date: datetime = Field()
 
 
+class ContactPatch(BaseModel):
+    id: int
+    name: str | None = Field(None, max_length=30)
+    surname: str | None = Field(None, max_length=30)
+    email: EmailStr | None = None
+    phone: PhoneNumber | None = Field(None, max_length=13)
+    born_date: datetime | None = None
+
+
+class ContactBatchDelete(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=settings.batch_max_size)
+
+
+class ContactBatchUpdate(BaseModel):
+    items: List[ContactPatch] = Field(min_length=1, max_length=settings.batch_max_size)
+
+
+class ContactBatchResult(BaseModel):
+    id: int
+    status: str
+
+
+class ContactImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ContactImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ContactImportError]
+
+
+class ContactSuggestion(BaseModel):
+    id: int
+    label: str
+
+
+class BatchOperation(BaseModel):
+    method: str = Field(pattern="^(GET|POST|PUT|PATCH|DELETE)$")
+    url: str = Field(pattern="^/api/", max_length=2048)
+    headers: Dict[str, str] = {}
+    body: Any = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchOperation] = Field(min_length=1, max_length=settings.batch_max_requests)
+    atomic: bool = False
+
+
+class BatchResult(BaseModel):
+    status: int
+    headers: Dict[str, str]
+    body: Any = None
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=20)
     email: EmailStr
@@ -1,17 +1,24 @@
-from typing import Optional
-import pickle
+import hashlib
+import time
+import uuid
+from typing import Optional, Tuple
 
-from fastapi import HTTPException, status, Depends
+import redis
+
+from fastapi import HTTPException, Request, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-import redis
 
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.executor import cpu_executor
+from src.services.cache import TTLCache, user_cache
+from src.services.metrics import BCRYPT_LATENCY
+from src.services.sessions import token_sessions, ROTATED
 
 
 class Auth:
@@ -19,11 +26,65 @@ class Auth:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    verified_tokens = TTLCache(maxsize=settings.token_cache_size, ttl=0)
+    rejected_tokens = TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_negative_ttl)
+
+    @staticmethod
+    def _token_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def decode_token(self, token: str) -> dict:
+        """
+        Verify a JWT and return its claims.
+
+        Verified claims are memoized until the token expires, rejected tokens are remembered for a short time.
+
+        :param token: The token to verify.
+        :type token: str
+        :return: The claims of the token.
+        :rtype: dict
+        :raises JWTError: If the token is invalid or was rejected recently.
+        """
+        key = self._token_key(token)
+        if self.rejected_tokens.get(key):
+            raise JWTError("Token was rejected")
+        payload = self.verified_tokens.get(key)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            except JWTError:
+                self.rejected_tokens.set(key, True)
+                raise
+            ttl = payload.get("exp", 0) - time.time()
+            if ttl > 0:
+                self.verified_tokens.set(key, payload, ttl=ttl)
+        return payload
+
+    def reject_token(self, token: str) -> None:
+        """
+        Remember a token that is valid but must not be accepted, e.g. it points to a deleted user.
+
+        :param token: The token to reject.
+        :type token: str
+        :return: None.
+        :rtype: None
+        """
+        key = self._token_key(token)
+        self.verified_tokens.pop(key)
+        self.rejected_tokens.set(key, True)
+
+    def token_cache_stats(self) -> dict:
+        """
+        Hit and miss counters of the verified and rejected token caches.
 
-    def verify_password(self, plain_password, hashed_password):
+        :return: Dict with stats of both caches.
+        :rtype: dict
         """
-        Verify the password.
+        return {"verified": self.verified_tokens.stats(), "rejected": self.rejected_tokens.stats()}
+
+    async def verify_password(self, plain_password, hashed_password):
+        """
+        Verify the password. Bcrypt runs in the CPU executor so the event loop stays free.
 
         :param plain_password: Password to verify.
         :type plain_password: str
@@ -32,18 +93,20 @@ class Auth:
         :return: True if the password is correct, False otherwise.
         :rtype: bool
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        with BCRYPT_LATENCY.labels("verify").time():
+            return await cpu_executor.run(self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password):
+    async def get_password_hash(self, password):
         """
-        Get the hashed password
+        Get the hashed password. Bcrypt runs in the CPU executor so the event loop stays free.
 
         :param password: Password to hash.
         :type password: str
         :return: Hashed password.
         :rtype: str
         """
-        return self.pwd_context.hash(password)
+        with BCRYPT_LATENCY.labels("hash").time():
+            return await cpu_executor.run(self.pwd_context.hash, password)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -65,55 +128,136 @@ class Auth:
         token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return token
 
+    def _encode_refresh_token(self, data: dict, jti: str, family: str, ttl: int) -> str:
+        to_encode = data.copy()
+        to_encode.update({"iat": datetime.utcnow(), "exp": datetime.utcnow() + timedelta(seconds=ttl),
+                          "scope": "refresh_token", "jti": jti, "fam": family})
+        return jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
         """
-        Create a new refresh token.
+        Create a new refresh token and start a new session for it.
+
+        Every login starts its own token family, so a user may have several sessions at once.
 
         :param data: Dict of data.
         :type data: dict
-        :param expires_delta: Expiration time in seconds to access token. Default value is 7 days.
+        :param expires_delta: Expiration time in seconds to refresh token. Default value is ``refresh_token_ttl``.
         :type expires_delta: float, optional
         :return: Refresh token
         :rtype: str
+        :raises HTTPException: 503 if the session store is unavailable.
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        ttl = int(expires_delta or settings.refresh_token_ttl)
+        jti, family = uuid.uuid4().hex, uuid.uuid4().hex
+        token = self._encode_refresh_token(data, jti, family, ttl)
+        try:
+            await token_sessions.create(data["sub"], jti, family, ttl)
+        except redis.RedisError as err:
+            print(err)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
         return token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    def decode_refresh_claims(self, refresh_token: str) -> dict:
         """
-        Decode a refresh token.
+        Verify a refresh token and return its claims.
 
         :param refresh_token: Refresh token to decode.
         :type refresh_token: str
-        :return: If refresh token is valid, return email of the user. Otherwise, return None/
-        :rtype: str
+        :return: The claims of the token.
+        :rtype: dict
+        :raises HTTPException: 401 if the token is invalid or is not a refresh token.
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload["scope"] == "refresh_token":
-                email = payload["sub"]
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token")
+            payload = self.decode_token(refresh_token)
         except JWTError as e:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+        if payload.get("scope") != "refresh_token":
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token")
+        if not payload.get("sub") or not payload.get("jti") or not payload.get("fam"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return payload
+
+    async def rotate_refresh_token(self, refresh_token: str) -> Tuple[str, str]:
+        """
+        Exchange a refresh token for a new one of the same session.
+
+        A refresh token can be used only once. Presenting a token that was already exchanged revokes its session,
+        since either the user or an attacker holds a stolen copy.
+
+        :param refresh_token: The presented refresh token.
+        :type refresh_token: str
+        :return: The email of the user and the new refresh token.
+        :rtype: Tuple[str, str]
+        :raises HTTPException: 401 if the token is invalid, reused or its session was revoked,
+            503 if the session store is unavailable.
+        """
+        payload = self.decode_refresh_claims(refresh_token)
+        email, ttl = payload["sub"], settings.refresh_token_ttl
+        jti = uuid.uuid4().hex
+        try:
+            result = await token_sessions.rotate(email, payload["jti"], payload["fam"], jti, ttl)
+        except redis.RedisError as err:
+            print(err)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
+        if result != ROTATED:
+            self.reject_token(refresh_token)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return email, self._encode_refresh_token({"sub": email}, jti, payload["fam"], ttl)
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def revoke_refresh_token(self, refresh_token: str) -> None:
+        """
+        End the session of a refresh token.
+
+        :param refresh_token: The refresh token.
+        :type refresh_token: str
+        :return: None.
+        :rtype: None
+        :raises HTTPException: 401 if the token is invalid, 503 if the session store is unavailable.
+        """
+        payload = self.decode_refresh_claims(refresh_token)
+        try:
+            await token_sessions.revoke(payload["jti"], payload["fam"])
+        except redis.RedisError as err:
+            print(err)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
+        self.reject_token(refresh_token)
+
+    async def revoke_all_refresh_tokens(self, email: str) -> None:
+        """
+        End every session of a user.
+
+        :param email: The email of the user.
+        :type email: str
+        :return: None.
+        :rtype: None
+        :raises HTTPException: 503 if the session store is unavailable.
+        """
+        try:
+            await token_sessions.revoke_all(email)
+        except redis.RedisError as err:
+            print(err)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
+
+    async def get_current_user(self, request: Request, token: str = Depends(oauth2_scheme),
+                               db: AsyncSession = Depends(get_db)):
         """
         Get current user information by token.
 
+        Sub-requests of a batch reuse the user resolved for the batch.
+
+        :param request: The request.
+        :type request: Request
         :param token: JWT token to get user info.
         :type token: str
         :param db: The database session.
-        :type db: Session
+        :type db: AsyncSession
         :return: User data or None if token is invalid.
         :rtype: User
         """
+        batch = request.scope.get("batch")
+        if batch is not None:
+            return batch["user"]
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -122,24 +266,22 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
+            payload = self.decode_token(token)
         except JWTError as e:
             raise credentials_exception
-        user = self.r.get(f"user:{email}")
-        if not user:
+        if payload.get("scope") != "access_token":
+            raise credentials_exception
+        email = payload.get("sub")
+        if email is None:
+            self.reject_token(token)
+            raise credentials_exception
+        user = await user_cache.get(email)
+        if user is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
+                self.reject_token(token)
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            await user_cache.set(user)
         return user
 
     def create_email_token(self, data: dict):
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+from typing import Dict, Iterable
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from src.conf.config import settings
+from src.services.executor import cpu_executor
+
+AVATAR_SIZES = (250, 64)
+READ_CHUNK_SIZE = 64 * 1024
+# decoded images larger than this are rejected before their pixels are loaded
+MAX_IMAGE_PIXELS = 40_000_000
+# room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies over a per-path limit before they are parsed.
+
+    Starlette spools the whole multipart body before a handler runs, so the limit must be enforced here:
+    a larger ``Content-Length`` is answered with 413 without reading the body, and a body without one is
+    cut off with 413 as soon as it exceeds the limit.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                  detail=f"Request body must not exceed {limit} bytes")
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = JSONResponse({"detail": too_large.detail}, status_code=too_large.status_code)
+                await response(scope, receive, send)
+                return
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # re-raised by FastAPI while parsing the body, and turned into the 413 response
+                    raise too_large
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """
+    Reads an uploaded file in chunks, stopping as soon as it exceeds the size limit.
+
+    :param file: The uploaded file.
+    :type file: UploadFile
+    :param max_bytes: The maximum size of the file.
+    :type max_bytes: int
+    :return: The content of the file.
+    :rtype: bytes
+    :raises HTTPException: 413 if the file is too large.
+    """
+    data = bytearray()
+    while chunk := await file.read(READ_CHUNK_SIZE):
+        data += chunk
+        if len(data) > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Avatar must not exceed {max_bytes} bytes")
+    return bytes(data)
+
+
+def make_thumbnails(data: bytes, sizes: Iterable[int] = AVATAR_SIZES) -> Dict[int, bytes]:
+    """
+    Decodes an image and crops it to square JPEG thumbnails. Blocking, run it in the CPU executor.
+
+    :param data: The encoded image.
+    :type data: bytes
+    :param sizes: The side lengths of the thumbnails in pixels.
+    :type sizes: Iterable[int]
+    :return: Dict of encoded thumbnails by size.
+    :rtype: Dict[int, bytes]
+    :raises ValueError: If the data is not a supported image or is too large when decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError("Image is too large")
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as err:
+        raise ValueError(f"Not a supported image: {err}")
+    thumbnails = {}
+    for size in sizes:
+        out = io.BytesIO()
+        ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS).save(out, format="JPEG", quality=85, optimize=True)
+        thumbnails[size] = out.getvalue()
+    return thumbnails
+
+
+class LocalStorage:
+    """
+    Stores avatars as files served by the application under ``base_url``.
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, name: str, data: bytes) -> None:
+        path = (self.root / f"{name}.jpg").resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Avatar name {name!r} leaves the storage directory")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def save(self, name: str, data: bytes) -> str:
+        """
+        Save an image.
+
+        :param name: The name of the image, without extension.
+        :type name: str
+        :param data: The encoded JPEG image.
+        :type data: bytes
+        :return: The URL of the image; it changes with the content, so clients do not keep the old one.
+        :rtype: str
+        """
+        await asyncio.to_thread(self._write, name, data)
+        return f"{self.base_url}/{name}.jpg?v={hashlib.sha1(data).hexdigest()[:12]}"
+
+
+class CloudinaryStorage:
+    """
+    Stores avatars in Cloudinary. The client is configured once, uploads run in a thread.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, folder: str = "NotesApp"):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        self.folder = folder
+
+    async def save(self, name: str, data: bytes) -> str:
+        """
+        Upload an image.
+
+        :param name: The name of the image, without extension.
+        :type name: str
+        :param data: The encoded JPEG image.
+        :type data: bytes
+        :return: The URL of the uploaded version of the image.
+        :rtype: str
+        """
+        r = await asyncio.to_thread(cloudinary.uploader.upload, data, public_id=f"{self.folder}/{name}",
+                                    overwrite=True)
+        return r["secure_url"]
+
+
+def create_storage():
+    """
+    Creates the avatar storage selected by the ``avatar_storage`` setting: ``cloudinary`` or ``local``.
+
+    :return: The storage backend.
+    :rtype: CloudinaryStorage | LocalStorage
+    """
+    if settings.avatar_storage == "local":
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_local_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret)
+
+
+class AvatarService:
+    """
+    Turns an uploaded image into avatar thumbnails and stores them.
+    """
+
+    def __init__(self, storage, sizes: Iterable[int] = AVATAR_SIZES):
+        self.storage = storage
+        self.sizes = tuple(sizes)
+
+    async def update(self, user_id: int, file: UploadFile) -> str:
+        """
+        Process and store the avatar of a user.
+
+        The upload is read up to ``avatar_max_bytes``, resized in the CPU executor, and every size is stored
+        as ``{user_id}_{size}``; usernames are neither unique nor safe as file names.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param file: The uploaded image.
+        :type file: UploadFile
+        :return: The URL of the largest thumbnail.
+        :rtype: str
+        :raises HTTPException: 413 if the file is too large, 422 if it is not an image.
+        """
+        data = await read_upload(file, settings.avatar_max_bytes)
+        try:
+            thumbnails = await cpu_executor.run(make_thumbnails, data, self.sizes)
+        except ValueError as err:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+        urls = await asyncio.gather(*(self.storage.save(f"{user_id}_{size}", thumbnail)
+                                      for size, thumbnail in thumbnails.items()))
+        return urls[0]
+
+
+avatar_service = AvatarService(create_storage())
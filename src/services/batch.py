@@ -0,0 +1,146 @@
+import asyncio
+from typing import List
+from urllib.parse import urlsplit
+
+import orjson
+from fastapi import Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.schemas import BatchOperation
+from src.services.rate_limit import rate_limiter, route_group, request_subject
+
+BATCH_PATH = "/api/batch"
+# headers of the batch request that are not passed on to the sub-requests
+SKIPPED_HEADERS = {b"content-type", b"content-length", b"if-none-match", b"if-match"}
+SKIPPED_RESPONSE_HEADERS = {"content-length"}
+
+
+def operation_scope(request: Request, operation: BatchOperation, user: User, db: AsyncSession) -> dict:
+    """
+    Builds the ASGI scope of a sub-request. It carries the user and the session of the batch,
+    which :func:`src.database.db.get_db` and ``get_current_user`` return instead of resolving their own.
+
+    :param request: The batch request.
+    :type request: Request
+    :param operation: The sub-request.
+    :type operation: BatchOperation
+    :param user: The user resolved for the batch.
+    :type user: User
+    :param db: The session of the batch.
+    :type db: AsyncSession
+    :return: The ASGI scope.
+    :rtype: dict
+    """
+    url = urlsplit(operation.url)
+    headers = [(name, value) for name, value in request.scope["headers"] if name not in SKIPPED_HEADERS]
+    headers += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in operation.headers.items()]
+    headers.append((b"content-type", b"application/json"))
+    scope = {key: request.scope[key] for key in ("type", "asgi", "http_version", "scheme", "server", "client",
+                                                 "root_path", "app", "starlette.exception_handlers")
+             if key in request.scope}
+    scope.update(method=operation.method, path=url.path, raw_path=url.path.encode(),
+                 query_string=url.query.encode(), headers=headers, state=dict(request.scope.get("state", {})),
+                 batch={"user": user, "db": db})
+    return scope
+
+
+async def dispatch(request: Request, operation: BatchOperation, user: User, db: AsyncSession) -> dict:
+    """
+    Runs one sub-request through the application's router in-process.
+
+    The router is called directly, past the rate limit middleware, so the sub-request takes a token from the
+    bucket of its own route group here.
+
+    :param request: The batch request.
+    :type request: Request
+    :param operation: The sub-request.
+    :type operation: BatchOperation
+    :param user: The user resolved for the batch.
+    :type user: User
+    :param db: The session of the batch.
+    :type db: AsyncSession
+    :return: Dict with the status, headers and decoded body of the response.
+    :rtype: dict
+    """
+    if urlsplit(operation.url).path.rstrip("/") == BATCH_PATH:
+        return {"status": status.HTTP_400_BAD_REQUEST, "headers": {},
+                "body": {"detail": "Batches cannot be nested"}}
+    group = route_group(urlsplit(operation.url).path)
+    if group is not None:
+        allowed, headers = await rate_limiter.acquire(group, request_subject(request.scope))
+        if not allowed:
+            return {"status": status.HTTP_429_TOO_MANY_REQUESTS, "headers": headers,
+                    "body": {"detail": "Too many requests"}}
+    body = b"" if operation.body is None else orjson.dumps(operation.body)
+    scope = operation_scope(request, operation, user, db)
+    scope["headers"].append((b"content-length", str(len(body)).encode()))
+    sent = False
+    response = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "headers": {}}
+    chunks = []
+
+    async def receive() -> dict:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # the client of a sub-request never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode("latin-1"): value.decode("latin-1")
+                                   for name, value in message.get("headers", [])
+                                   if name.decode("latin-1") not in SKIPPED_RESPONSE_HEADERS}
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except Exception as err:
+        print(err)
+        return {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "headers": {},
+                "body": {"detail": "Internal Server Error"}}
+    content = b"".join(chunks)
+    if not content:
+        response["body"] = None
+    elif response["headers"].get("content-type", "").startswith("application/json"):
+        response["body"] = orjson.loads(content)
+    else:
+        response["body"] = content.decode()
+    return response
+
+
+async def run_batch(request: Request, operations: List[BatchOperation], user: User, db: AsyncSession,
+                    atomic: bool = False) -> List[dict]:
+    """
+    Runs sub-requests in order with one user and one session.
+
+    Without ``atomic`` a failed sub-request is rolled back on its own and the others still run.
+    With ``atomic`` the first failure stops the batch, the remaining sub-requests are answered with 424
+    and the caller is expected to roll back the whole transaction.
+
+    :param request: The batch request.
+    :type request: Request
+    :param operations: The sub-requests.
+    :type operations: List[BatchOperation]
+    :param user: The user resolved for the batch.
+    :type user: User
+    :param db: The session of the batch.
+    :type db: AsyncSession
+    :param atomic: Stop at the first failed sub-request.
+    :type atomic: bool
+    :return: Results of the sub-requests in order.
+    :rtype: List[dict]
+    """
+    results = []
+    for operation in operations:
+        if atomic and results and results[-1]["status"] >= status.HTTP_400_BAD_REQUEST:
+            results.append({"status": status.HTTP_424_FAILED_DEPENDENCY, "headers": {}, "body": None})
+            continue
+        result = await dispatch(request, operation, user, db)
+        if result["status"] >= status.HTTP_400_BAD_REQUEST and not atomic:
+            await db.rollback()
+        results.append(result)
+    return results
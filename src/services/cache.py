@@ -0,0 +1,445 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable
+
+import orjson
+import redis
+import redis.asyncio
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import PENDING_AFTER_COMMIT
+from src.database.models import User
+
+USER_CACHE_VERSION = 2
+USER_CACHE_FIELDS = ("id", "username", "email", "confirmed", "avatar")
+USER_CACHE_DATES = ("created_at", "updated_at")
+USER_INVALIDATION_CHANNEL = "user:invalidate"
+
+# reads the generation counter and the entry of that generation in one round trip
+RESPONSE_CACHE_GET = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return {generation, redis.call('GET', ARGV[1] .. generation .. ':' .. ARGV[2])}
+"""
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with a per-entry expiry time.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get a value if it is present and not expired.
+
+        :param key: The key to look up.
+        :return: The cached value or None.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        """
+        Store a value, evicting the least recently used entry when the cache is full.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        :param ttl: Time to live in seconds. Default is the cache TTL.
+        :type ttl: float, optional
+        :return: None.
+        :rtype: None
+        """
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        """
+        Remove a key if it is present.
+
+        :param key: The key to remove.
+        :return: None.
+        :rtype: None
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+
+        :return: None.
+        :rtype: None
+        """
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the cache.
+
+        :return: Dict with size, hits and misses.
+        :rtype: dict
+        """
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def encode_user(user: User) -> bytes:
+    """
+    Encodes the cached projection of a user: no password hash, no ORM state.
+
+    :param user: The user to encode.
+    :type user: User
+    :return: Compact JSON record with a schema version.
+    :rtype: bytes
+    """
+    record = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+    record["v"] = USER_CACHE_VERSION
+    for field in USER_CACHE_DATES:
+        value = getattr(user, field)
+        record[field] = value.isoformat() if value else None
+    return orjson.dumps(record)
+
+
+def decode_user(data: bytes) -> User | None:
+    """
+    Decodes a record written by :func:`encode_user`.
+
+    :param data: The cached record.
+    :type data: bytes
+    :return: A detached user, or None if the record is malformed or has another schema version.
+    :rtype: User | None
+    """
+    try:
+        record = orjson.loads(data)
+        if record.get("v") != USER_CACHE_VERSION:
+            return None
+        dates = {field: datetime.fromisoformat(record[field]) if record[field] else None for field in USER_CACHE_DATES}
+        return User(**{field: record[field] for field in USER_CACHE_FIELDS}, **dates)
+    except (orjson.JSONDecodeError, AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class UserCache:
+    """
+    Two-level cache of authenticated users: an in-process LRU in front of the shared Redis records.
+
+    Every worker drops its local copy when a ``user:invalidate`` message is published.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = r
+        self.local = TTLCache(maxsize=settings.user_l1_size, ttl=settings.user_l1_ttl)
+        self._pending = set()
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+
+    async def get(self, email: str) -> User | None:
+        """
+        Get a cached user.
+
+        :param email: The email of the user.
+        :type email: str
+        :return: A detached user, or None on a miss or if Redis is unavailable.
+        :rtype: User | None
+        """
+        user = self.local.get(email)
+        if user is None:
+            try:
+                cached = await self.r.get(f"user:{email}")
+            except redis.RedisError as err:
+                print(err)
+                return None
+            user = decode_user(cached) if cached else None
+            if user is not None:
+                self.redis_hits += 1
+                self.local.set(email, user)
+            else:
+                self.redis_misses += 1
+        return user
+
+    def redis_stats(self) -> dict:
+        """
+        Hit and miss counters of the Redis records, counted on local misses only.
+
+        :return: Dict with hits and misses.
+        :rtype: dict
+        """
+        return {"hits": self.redis_hits, "misses": self.redis_misses}
+
+    async def set(self, user: User) -> None:
+        """
+        Cache a user in Redis and in the local cache.
+
+        :param user: The user to cache.
+        :type user: User
+        :return: None.
+        :rtype: None
+        """
+        data = encode_user(user)
+        self.local.set(user.email, decode_user(data))
+        try:
+            await self.r.set(f"user:{user.email}", data, ex=settings.user_cache_ttl)
+        except redis.RedisError as err:
+            print(err)
+
+    def invalidate(self, email: str) -> None:
+        """
+        Drop a user from the local cache now, and from Redis and the local cache of every worker
+        in a task of the running event loop.
+
+        :param email: The email of the user.
+        :type email: str
+        :return: None.
+        :rtype: None
+        """
+        self.local.pop(email)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # a synchronous session outside the application
+            return
+        if self.r is not None:
+            task = loop.create_task(self.publish(email))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def publish(self, email: str) -> None:
+        """
+        Delete the Redis record of a user and notify the other workers in one round trip.
+
+        :param email: The email of the user.
+        :type email: str
+        :return: None.
+        :rtype: None
+        """
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.delete(f"user:{email}")
+                pipe.publish(USER_INVALIDATION_CHANNEL, email)
+                await pipe.execute()
+        except redis.RedisError as err:
+            print(err)
+
+    async def listen(self) -> None:
+        """
+        Drop local entries on invalidation messages from other workers. Runs until cancelled.
+
+        :return: None.
+        :rtype: None
+        """
+        while True:
+            try:
+                async with self.r.pubsub() as pubsub:
+                    await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+                    # messages may have been missed while disconnected
+                    self.local.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.local.pop(message["data"].decode())
+            except redis.RedisError as err:
+                print(err)
+                await asyncio.sleep(1)
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized per-user responses in Redis.
+
+    Entries live under ``{prefix}:{user_id}:{generation}:{digest}`` with a TTL. Every write to the user's data
+    increments ``{prefix}:{user_id}:gen``, so older entries are never read again and simply expire.
+    The generation keys have no TTL, so with ``maxmemory-policy volatile-lru`` only entries are evicted.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None, prefix: str, ttl: int):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.r = None
+        self._get = None
+        if r is not None:
+            self.connect(r)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.stored_bytes = 0
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._get = r.register_script(RESPONSE_CACHE_GET)
+
+    @staticmethod
+    def digest(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    async def get(self, user_id: int, key: str) -> tuple:
+        """
+        Get a cached response.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param key: The route and query parameters of the response.
+        :type key: str
+        :return: The current generation (None if Redis is unavailable) and the cached (body, headers) or None.
+        :rtype: tuple
+        """
+        try:
+            generation, entry = await self._get(keys=[f"{self.prefix}:{user_id}:gen"],
+                                                args=[f"{self.prefix}:{user_id}:", self.digest(key)])
+        except redis.RedisError as err:
+            print(err)
+            return None, None
+        if entry is None:
+            self.misses += 1
+            return generation, None
+        self.hits += 1
+        headers, body = entry.split(b"\n", 1)
+        return generation, (body, orjson.loads(headers))
+
+    async def set(self, user_id: int, generation, key: str, body: bytes, headers: dict | None = None) -> None:
+        """
+        Cache a response under the generation it was read with.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param generation: The generation returned by :meth:`get`.
+        :param key: The route and query parameters of the response.
+        :type key: str
+        :param body: The serialized response body.
+        :type body: bytes
+        :param headers: Response headers to cache with the body.
+        :type headers: dict, optional
+        :return: None.
+        :rtype: None
+        """
+        if generation is None:
+            return
+        generation = generation.decode() if isinstance(generation, bytes) else generation
+        entry = orjson.dumps(headers or {}) + b"\n" + body
+        try:
+            await self.r.set(f"{self.prefix}:{user_id}:{generation}:{self.digest(key)}", entry, ex=self.ttl)
+        except redis.RedisError as err:
+            print(err)
+            return
+        self.stored += 1
+        self.stored_bytes += len(entry)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        Invalidate all cached responses of a user.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :return: None.
+        :rtype: None
+        """
+        try:
+            await self.r.incr(f"{self.prefix}:{user_id}:gen")
+        except redis.RedisError as err:
+            print(err)
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters and the amount of data written to the cache.
+
+        :return: Dict with hits, misses, hit ratio, stored entries and bytes.
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0,
+                "stored": self.stored, "stored_bytes": self.stored_bytes}
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+user_cache = UserCache()
+contacts_cache = ResponseCache(None, prefix="contacts", ttl=settings.response_cache_ttl)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_users(session, flush_context) -> None:
+    """
+    Remember users whose cached fields were changed or who were deleted in this transaction.
+    """
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(state.attrs[field].history.has_changes() for field in USER_CACHE_FIELDS):
+            changed = session.info.setdefault("changed_users", set())
+            changed.add(obj.email)
+            changed.update(state.attrs.email.history.deleted or ())
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_users(session) -> None:
+    """
+    Invalidate cached users once their changes are committed. Inside an atomic batch the commit only releases
+    a savepoint, so the invalidation waits in the session until the whole batch commits.
+    """
+    changed = session.info.pop("changed_users", ())
+    pending = session.info.get(PENDING_AFTER_COMMIT)
+    if pending is not None:
+        if changed:
+            pending.append((invalidate_users, (changed,)))
+        return
+    for email in changed:
+        user_cache.invalidate(email)
+
+
+async def invalidate_users(emails: Iterable[str]) -> None:
+    """
+    Invalidate cached users after the outer transaction of an atomic batch committed.
+
+    :param emails: The emails of the users.
+    :type emails: Iterable[str]
+    :return: None.
+    :rtype: None
+    """
+    for email in emails:
+        user_cache.invalidate(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_users(session) -> None:
+    """
+    Forget collected users when the transaction is rolled back.
+    """
+    session.info.pop("changed_users", None)
@@ -0,0 +1,215 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator, Tuple, List, AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+CONTACT_FIELDS = ("name", "surname", "email", "phone", "born_date")
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "vcard": "text/vcard",
+}
+EXPORT_EXTENSIONS = {
+    "ndjson": "ndjson",
+    "csv": "csv",
+    "vcard": "vcf",
+}
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str | None:
+    """
+    Detects the format of an uploaded contacts file from its extension or content type.
+
+    :param filename: The name of the uploaded file.
+    :type filename: str, optional
+    :param content_type: The content type of the uploaded file.
+    :type content_type: str, optional
+    :return: ``csv``, ``ndjson`` or None if the format is unknown.
+    :rtype: str | None
+    """
+    if filename and "." in filename:
+        fmt = FORMATS.get(filename[filename.rfind("."):].lower())
+        if fmt:
+            return fmt
+    return FORMATS.get((content_type or "").split(";")[0].strip().lower())
+
+
+def iter_rows(file: BinaryIO, fmt: str) -> Iterator[Tuple[int, dict | None, str | None]]:
+    """
+    Reads rows of a contacts file one by one without loading it into memory.
+
+    :param file: The binary file to read.
+    :type file: BinaryIO
+    :param fmt: ``csv`` or ``ndjson``.
+    :type fmt: str
+    :return: Iterator of (row number, row, parse error) tuples; row is None when it could not be parsed.
+    :rtype: Iterator[Tuple[int, dict | None, str | None]]
+    :raises UnicodeDecodeError: If the file is not UTF-8.
+    :raises csv.Error: If the CSV file is malformed.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, {key: value for key, value in row.items() if key in CONTACT_FIELDS}, None
+        else:
+            for row_no, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield row_no, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield row_no, None, "Row must be a JSON object"
+                    continue
+                yield row_no, row, None
+    finally:
+        text.detach()
+
+
+def validation_messages(error: ValidationError) -> List[str]:
+    """
+    Short messages for each failed field of a validation error.
+
+    :param error: The validation error.
+    :type error: ValidationError
+    :return: List of ``field: message`` strings.
+    :rtype: List[str]
+    """
+    return [f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in error.errors()]
+
+
+async def import_contacts(file: BinaryIO, fmt: str, user: User, db: AsyncSession) -> dict:
+    """
+    Validates rows of a contacts file and inserts them in chunks, one transaction per chunk.
+
+    Only one chunk of rows and at most ``import_max_errors`` error entries are kept in memory.
+
+    :param file: The binary file to read.
+    :type file: BinaryIO
+    :param fmt: ``csv`` or ``ndjson``.
+    :type fmt: str
+    :param user: The user to import the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Dict with the number of imported and failed rows and the per-row errors.
+    :rtype: dict
+    :raises UnicodeDecodeError: If the file is not UTF-8.
+    :raises csv.Error: If the CSV file is malformed.
+    """
+    report = {"imported": 0, "failed": 0, "errors": []}
+    chunk, chunk_rows = [], []
+
+    def fail(row_no: int, messages: List[str]) -> None:
+        report["failed"] += 1
+        if len(report["errors"]) < settings.import_max_errors:
+            report["errors"].append({"row": row_no, "errors": messages})
+
+    async def flush() -> None:
+        try:
+            report["imported"] += await repository_contacts.create_contacts(chunk, user, db)
+        except SQLAlchemyError as e:
+            await db.rollback()
+            for row_no in chunk_rows:
+                fail(row_no, [f"Database error: {e.__class__.__name__}"])
+        chunk.clear()
+        chunk_rows.clear()
+
+    for row_no, row, error in iter_rows(file, fmt):
+        if error:
+            fail(row_no, [error])
+            continue
+        try:
+            chunk.append(ContactModel(**row))
+            chunk_rows.append(row_no)
+        except ValidationError as e:
+            fail(row_no, validation_messages(e))
+        if len(chunk) >= settings.import_chunk_size:
+            await flush()
+    await flush()
+    return report
+
+
+def vcard_escape(value: str | None) -> str:
+    """
+    Escapes a vCard property value.
+    """
+    if value is None:
+        return ""
+    return (value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def format_rows(rows: List[Row], fmt: str) -> str:
+    """
+    Serializes a batch of exported contacts.
+
+    :param rows: Rows with name, surname, email, phone and born_date.
+    :type rows: List[Row]
+    :param fmt: ``ndjson``, ``csv`` or ``vcard``.
+    :type fmt: str
+    :return: The serialized batch.
+    :rtype: str
+    """
+    if fmt == "ndjson":
+        return "".join(json.dumps({"name": row.name, "surname": row.surname, "email": row.email, "phone": row.phone,
+                                   "born_date": row.born_date.isoformat()}) + "\n" for row in rows)
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.writer(out).writerows((row.name, row.surname, row.email, row.phone, row.born_date.isoformat())
+                                  for row in rows)
+        return out.getvalue()
+    return "".join(
+        "BEGIN:VCARD\r\nVERSION:3.0\r\n"
+        f"N:{vcard_escape(row.surname)};{vcard_escape(row.name)};;;\r\n"
+        f"FN:{vcard_escape(f'{row.name} {row.surname}')}\r\n"
+        f"EMAIL:{vcard_escape(row.email)}\r\n"
+        f"TEL:{vcard_escape(row.phone)}\r\n"
+        f"BDAY:{row.born_date.date().isoformat()}\r\n"
+        "END:VCARD\r\n"
+        for row in rows)
+
+
+async def export_contacts(rows: AsyncIterator[Row], fmt: str) -> AsyncIterator[str]:
+    """
+    Serializes streamed contacts in batches, so memory use does not depend on the number of contacts.
+
+    :param rows: Async iterator of rows with name, surname, email, phone and born_date.
+    :type rows: AsyncIterator[Row]
+    :param fmt: ``ndjson``, ``csv`` or ``vcard``.
+    :type fmt: str
+    :return: Async iterator of serialized chunks.
+    :rtype: AsyncIterator[str]
+    """
+    if fmt == "csv":
+        yield ",".join(CONTACT_FIELDS) + "\r\n"
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= settings.export_batch_size:
+            yield format_rows(batch, fmt)
+            batch.clear()
+    if batch:
+        yield format_rows(batch, fmt)
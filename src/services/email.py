@@ -1,25 +1,160 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from aiosmtplib import SMTP, SMTPException, SMTPServerDisconnected
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.conf.config import settings
+from src.services.metrics import EMAIL_SEND_LATENCY
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+FROM_NAME = "Desired Name"
+
+# templates are compiled once at import, rendering a message only fills the values in
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'),
+                        autoescape=select_autoescape(["html"]))
+verification_template = templates.get_template("email_template.html")
+
+
+class SMTPPool:
+    """
+    Pool of long-lived authenticated SMTP connections.
+
+    At most ``size`` sessions are open at once. A connection idle for longer than ``keepalive`` seconds is
+    checked with NOOP before reuse, and a message that fails on a dropped connection is retried once on a new one.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str | None = None, password: str | None = None,
+                 use_tls: bool = True, start_tls: bool = False, size: int = 4, keepalive: float = 60,
+                 timeout: float = 10):
+        self.options = dict(hostname=hostname, port=port, username=username, password=password, use_tls=use_tls,
+                            start_tls=start_tls, timeout=timeout)
+        self.size = size
+        self.keepalive = keepalive
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self.connections = 0
+        self.sent = 0
+        self.failed = 0
+
+    async def _connect(self) -> SMTP:
+        smtp = SMTP(**self.options)
+        await smtp.connect()
+        self.connections += 1
+        return smtp
+
+    async def _checkout(self) -> SMTP:
+        while self._idle:
+            smtp, last_used = self._idle.pop()
+            if not smtp.is_connected:
+                continue
+            if time.monotonic() - last_used < self.keepalive:
+                return smtp
+            try:
+                await smtp.noop()
+                return smtp
+            except (SMTPException, OSError):
+                smtp.close()
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Borrow a connection, waiting while ``size`` connections are in use.
+
+        A connection that raised is closed instead of being returned to the pool.
+        """
+        async with self._slots:
+            smtp = await self._checkout()
+            try:
+                yield smtp
+            except BaseException:
+                smtp.close()
+                raise
+            self._idle.append((smtp, time.monotonic()))
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        Send a message over a pooled connection.
+
+        :param message: The message to send.
+        :type message: EmailMessage
+        :return: None.
+        :rtype: None
+        :raises SMTPException: If the server rejects the message.
+        :raises OSError: If the server cannot be reached.
+        """
+        for attempt in range(2):
+            try:
+                async with self.connection() as smtp:
+                    await smtp.send_message(message)
+                self.sent += 1
+                return
+            except SMTPServerDisconnected:
+                # the server closed an idle connection
+                if attempt:
+                    self.failed += 1
+                    raise
+            except (SMTPException, OSError):
+                self.failed += 1
+                raise
+
+    async def close(self) -> None:
+        """
+        Close the idle connections.
+
+        :return: None.
+        :rtype: None
+        """
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            try:
+                await smtp.quit()
+            except (SMTPException, OSError):
+                smtp.close()
+
+    def stats(self) -> dict:
+        """
+        Connection and delivery counters of the pool.
+
+        :return: Dict with the pool size, idle and opened connections, sent and failed messages.
+        :rtype: dict
+        """
+        return {"size": self.size, "idle": len(self._idle), "connections": self.connections, "sent": self.sent,
+                "failed": self.failed}
+
+
+smtp_pool = SMTPPool(settings.mail_server, settings.mail_port, settings.mail_username, settings.mail_password,
+                     use_tls=settings.mail_ssl_tls, start_tls=settings.mail_starttls, size=settings.smtp_pool_size,
+                     keepalive=settings.smtp_keepalive, timeout=settings.smtp_timeout)
+
+
+def verification_message(email: EmailStr, username: str, host: str) -> EmailMessage:
+    """
+    Build the message to verify an email address.
+
+    :param email: Email address to send message.
+    :type email: EmailStr
+    :param username: Username of the recipient.
+    :type username: str
+    :param host: Hostname of the recipient.
+    :type host: str
+    :return: The message.
+    :rtype: EmailMessage
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    message = EmailMessage()
+    message["Subject"] = "Confirm your email "
+    message["From"] = formataddr((FROM_NAME, settings.mail_from))
+    message["To"] = email
+    message.set_content(verification_template.render(host=host, username=username, token=token_verification),
+                        subtype="html")
+    return message
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -34,17 +169,14 @@ async def send_email(email: EmailStr, username: str, host: str):
     :type host: str
     :return: None.
     :rtype: None
+    :raises SMTPException: If the server rejects the message.
+    :raises OSError: If the server cannot be reached.
     """
+    message = verification_message(email, username, host)
+    start = time.perf_counter()
+    result = "failed"
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+        await smtp_pool.send(message)
+        result = "sent"
+    finally:
+        EMAIL_SEND_LATENCY.labels(result).observe(time.perf_counter() - start)
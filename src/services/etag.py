@@ -0,0 +1,32 @@
+import hashlib
+
+from fastapi import Request
+
+
+def make_etag(*parts) -> str:
+    """
+    Builds a strong entity tag from the values that identify a version of a resource.
+
+    :param parts: Values such as IDs, update times and counts.
+    :return: Quoted entity tag.
+    :rtype: str
+    """
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+
+def not_modified(request: Request, etag: str | None) -> bool:
+    """
+    Checks whether the ``If-None-Match`` header of a request matches an entity tag.
+
+    :param request: The request.
+    :type request: Request
+    :param etag: The current entity tag of the resource, None if it has none.
+    :type etag: str | None
+    :return: True if the client already has this version.
+    :rtype: bool
+    """
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
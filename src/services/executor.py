@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+
+
+class CpuExecutor:
+    """
+    Bounded thread pool for CPU-heavy work such as bcrypt hashing.
+
+    Jobs over ``max_queue`` waiting on the pool are rejected with 503 instead of piling up on the event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        """
+        Start the worker threads.
+
+        :return: None.
+        :rtype: None
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cpu")
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads, waiting for running jobs to finish.
+
+        :return: None.
+        :rtype: None
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def run(self, func, *args):
+        """
+        Run a function in the pool and wait for its result.
+
+        :param func: The function to run.
+        :type func: Callable
+        :param args: Positional arguments for the function.
+        :return: The result of the function.
+        :raises HTTPException: 503 if the queue is full.
+        """
+        if self.queued >= self.max_queue:
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy",
+                                headers={"Retry-After": "1"})
+        self.start()
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        def job():
+            wait = time.perf_counter() - submitted
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+
+        return await asyncio.get_running_loop().run_in_executor(self._pool, job)
+
+    def stats(self) -> dict:
+        """
+        Queue depth and wait time of the pool.
+
+        :return: Dict with the current counters.
+        :rtype: dict
+        """
+        return {
+            "workers": self.max_workers,
+            "running": self.running,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_wait": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+cpu_executor = CpuExecutor(max_workers=settings.cpu_pool_size, max_queue=settings.cpu_pool_max_queue)
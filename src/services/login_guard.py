@@ -0,0 +1,107 @@
+import math
+import time
+import uuid
+
+import redis
+import redis.asyncio
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+
+# KEYS: login:ip:{ip}, login:account:{email}
+# ARGV: now (ms), attempt id, then the limit and window (ms) of each key
+# returns 0 and records the attempt if every window has room, otherwise the milliseconds until the oldest
+# attempt of the fullest window expires
+LOGIN_GATE = """
+local now = tonumber(ARGV[1])
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + 2 * i])
+    local window = tonumber(ARGV[2 + 2 * i])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        wait = math.max(wait, tonumber(oldest[2]) + window - now)
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('PEXPIRE', key, ARGV[2 + 2 * i])
+end
+return 0
+"""
+
+
+class LoginGuard:
+    """
+    Sliding-window limits of login attempts per client IP and per account, checked before the password is hashed.
+
+    ``login:ip:{ip}`` and ``login:account:{email}`` are sorted sets of attempt timestamps. Both are checked and
+    updated by one Lua script, so a rejected attempt costs one Redis round trip and no bcrypt.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = None
+        self._gate = None
+        if r is not None:
+            self.connect(r)
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._gate = r.register_script(LOGIN_GATE)
+
+    async def check(self, ip: str, email: str) -> None:
+        """
+        Record a login attempt, or reject it if the client IP or the account is over its limit.
+
+        Attempts are allowed if Redis is unavailable.
+
+        :param ip: The client IP.
+        :type ip: str
+        :param email: The email the client tries to log in as.
+        :type email: str
+        :return: None.
+        :rtype: None
+        :raises HTTPException: 429 with Retry-After if there were too many attempts.
+        """
+        try:
+            wait = await self._gate(
+                keys=[f"login:ip:{ip}", f"login:account:{email.casefold()}"],
+                args=[int(time.time() * 1000), uuid.uuid4().hex,
+                      settings.login_ip_limit, settings.login_ip_window * 1000,
+                      settings.login_account_limit, settings.login_account_window * 1000])
+        except redis.RedisError as err:
+            print(err)
+            return
+        if wait:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login attempts",
+                                headers={"Retry-After": str(math.ceil(wait / 1000))})
+
+    async def reset(self, email: str) -> None:
+        """
+        Forget the attempts of an account after a successful login.
+
+        :param email: The email of the account.
+        :type email: str
+        :return: None.
+        :rtype: None
+        """
+        try:
+            await self.r.delete(f"login:account:{email.casefold()}")
+        except redis.RedisError as err:
+            print(err)
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+login_guard = LoginGuard()
@@ -0,0 +1,264 @@
+import time
+from collections import Counter as Tally
+
+from prometheus_client import Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of HTTP requests.", ["method", "route"])
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of database statements.", ["operation"])
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection.")
+DB_CONNECTIONS_IN_USE = Gauge("db_pool_connections_in_use", "Database connections checked out of the pool.")
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Latency of Redis commands and pipelines.",
+                          ["command"], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+BCRYPT_LATENCY = Histogram("bcrypt_duration_seconds", "Time to hash or verify a password, including the wait "
+                           "for the CPU executor.", ["operation"], buckets=(.05, .1, .2, .3, .5, .75, 1, 2.5, 5))
+EMAIL_SEND_LATENCY = Histogram("email_send_duration_seconds", "Time to send an email through the SMTP pool.",
+                               ["result"], buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+QUERY_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "COMMIT"}
+# labelled histograms by statement class, looked up in a dict instead of through the locked ``labels()``
+query_histograms = {}
+# plain counters on the request path, exported by ServiceCollector at scrape time
+requests_by_status = Tally()
+requests_in_progress = Tally()
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and in-flight counts of HTTP requests.
+
+    Requests are labelled with their route template, looked up from the endpoint the router resolved, so paths
+    with IDs do not create new series. In-flight requests are counted by the routes, see ``instrument_routes``.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.templates = {}
+        # labelled histograms, looked up in a dict instead of through the locked ``labels()``
+        self.histograms = {}
+
+    def route_template(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self.templates.get(endpoint)
+        if template is None:
+            for route in scope["app"].routes:
+                if isinstance(route, Mount):
+                    self.templates[route.app] = route.path
+                else:
+                    self.templates[route.endpoint] = route.path
+            template = self.templates.get(endpoint, "unmatched")
+        return template
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            labels = (scope["method"], self.route_template(scope))
+            histogram = self.histograms.get(labels)
+            if histogram is None:
+                histogram = self.histograms[labels] = REQUEST_LATENCY.labels(*labels)
+            histogram.observe(elapsed)
+            requests_by_status[labels + (str(status),)] += 1
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool that records how long a checkout waited for a free connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+class TimedSession(AsyncSession):
+    """
+    Session that records the latency of its statements by operation, and of its commits, which flush the
+    pending inserts, updates and deletes.
+
+    Statements are timed here instead of through engine events: with any connection event listener,
+    SQLAlchemy sends every statement through its event dispatch, which costs more than the timing itself.
+    """
+
+    async def execute(self, statement, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(statement, *args, **kwargs)
+        finally:
+            observe_query(type(statement), time.perf_counter() - start)
+
+    async def stream(self, statement, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().stream(statement, *args, **kwargs)
+        finally:
+            observe_query(type(statement), time.perf_counter() - start)
+
+    async def commit(self) -> None:
+        start = time.perf_counter()
+        try:
+            await super().commit()
+        finally:
+            observe_query(None, time.perf_counter() - start)
+
+
+def observe_query(statement_type, elapsed: float) -> None:
+    """
+    Records the latency of a statement, labelled with its operation, or of a commit.
+
+    :param statement_type: The class of the statement, ``None`` for a commit.
+    :param elapsed: The latency in seconds.
+    :type elapsed: float
+    :return: None.
+    :rtype: None
+    """
+    histogram = query_histograms.get(statement_type)
+    if histogram is None:
+        operation = "COMMIT" if statement_type is None else statement_type.__visit_name__.upper()
+        if operation not in QUERY_OPERATIONS:
+            operation = "OTHER"
+        histogram = query_histograms[statement_type] = DB_QUERY_LATENCY.labels(operation)
+    histogram.observe(elapsed)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Tracks the connections in use through pool events.
+
+    :param engine: The synchronous engine, ``AsyncEngine.sync_engine`` for async engines.
+    :type engine: Engine
+    :return: None.
+    :rtype: None
+    """
+
+    @event.listens_for(engine.pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_CONNECTIONS_IN_USE.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        DB_CONNECTIONS_IN_USE.dec()
+
+
+def instrument_routes(routes: list) -> None:
+    """
+    Counts the requests in flight per route template, around the handler each route calls once it matched.
+
+    Sub-requests of a batch are dispatched through the same routes and are counted as well.
+
+    :param routes: The routes of the application.
+    :type routes: list
+    :return: None.
+    :rtype: None
+    """
+    for route in routes:
+        if not getattr(route.app, "counts_in_progress", False):
+            route.app = count_in_progress(route.app, route.path)
+
+
+def count_in_progress(app: ASGIApp, template: str) -> ASGIApp:
+    """
+    Wraps the handler of a route to count its requests in flight.
+    """
+    async def counted(scope: Scope, receive: Receive, send: Send) -> None:
+        requests_in_progress[template] += 1
+        try:
+            await app(scope, receive, send)
+        finally:
+            requests_in_progress[template] -= 1
+
+    counted.counts_in_progress = True
+    return counted
+
+
+class ServiceCollector:
+    """
+    Exposes the counters the services already keep for ``/api/health`` at scrape time, so they cost nothing
+    per request.
+    """
+
+    def describe(self):
+        # the services are imported on the first scrape, not when the collector is registered
+        return []
+
+    def collect(self):
+        from src.database.db import engine
+        from src.services.auth import auth_service
+        from src.services.cache import user_cache, contacts_cache
+        from src.services.email import smtp_pool
+        from src.services.executor import cpu_executor
+        from src.services.rate_limit import rate_limiter
+
+        in_progress = GaugeMetricFamily("http_requests_in_progress", "HTTP requests being handled.",
+                                        labels=["route"])
+        for route, count in requests_in_progress.items():
+            in_progress.add_metric([route], count)
+        yield in_progress
+        by_status = CounterMetricFamily("http_requests", "HTTP requests by response status.",
+                                        labels=["method", "route", "status"])
+        for labels, count in requests_by_status.items():
+            by_status.add_metric(list(labels), count)
+        yield by_status
+
+        token_cache = auth_service.token_cache_stats()
+        caches = {
+            "user_local": user_cache.local.stats(),
+            "user_redis": user_cache.redis_stats(),
+            "token_verified": token_cache["verified"],
+            "token_rejected": token_cache["rejected"],
+            "contacts_response": contacts_cache.stats(),
+            "rate_limit_reservation": rate_limiter.local.stats(),
+        }
+        hits = CounterMetricFamily("cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses.", labels=["cache"])
+        for name, stats in caches.items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+        yield hits
+        yield misses
+
+        pool = engine.pool
+        if hasattr(pool, "size"):
+            yield GaugeMetricFamily("db_pool_size", "Connections the pool keeps open.", value=pool.size())
+            yield GaugeMetricFamily("db_pool_overflow", "Connections opened beyond the pool size.",
+                                    value=max(pool.overflow(), 0))
+
+        executor = cpu_executor.stats()
+        yield GaugeMetricFamily("cpu_executor_running", "Jobs running in the CPU executor.", value=executor["running"])
+        yield GaugeMetricFamily("cpu_executor_queued", "Jobs waiting for the CPU executor.", value=executor["queued"])
+        yield CounterMetricFamily("cpu_executor_rejected", "Jobs rejected by the full CPU executor.",
+                                  value=executor["rejected"])
+
+        smtp = smtp_pool.stats()
+        yield GaugeMetricFamily("smtp_pool_idle", "Idle SMTP connections.", value=smtp["idle"])
+        messages = CounterMetricFamily("smtp_messages", "Messages handed to the SMTP server.", labels=["result"])
+        messages.add_metric(["sent"], smtp["sent"])
+        messages.add_metric(["failed"], smtp["failed"])
+        yield messages
+        yield CounterMetricFamily("smtp_connections", "SMTP connections opened.", value=smtp["connections"])
+
+
+REGISTRY.register(ServiceCollector())
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+import redis
+import redis.asyncio
+
+from src.conf.config import settings
+from src.services.email import send_email, smtp_pool
+from src.services.redis_pool import create_redis
+
+OUTBOX_STREAM = "outbox:email"
+OUTBOX_GROUP = "email-workers"
+RETRY_KEY = "outbox:email:retry"
+DEAD_LETTER_STREAM = "outbox:email:dead"
+MESSAGE_FIELDS = ("email", "username", "host")
+
+# KEYS: outbox:email:retry, outbox:email
+# ARGV: now, batch size, stream max length
+# re-adds due messages to the stream and removes them from the retry set in one step, so a crash cannot lose them
+PROMOTE_RETRIES = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(members) do
+    local parts = {}
+    for part in string.gmatch(member .. '\\0', '([^%z]*)%z') do
+        parts[#parts + 1] = part
+    end
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*',
+               'email', parts[1], 'username', parts[2], 'host', parts[3], 'attempts', parts[4])
+    redis.call('ZREM', KEYS[1], member)
+end
+return #members
+"""
+
+
+class EmailOutbox:
+    """
+    Durable queue of outbound emails in a Redis stream.
+
+    Workers read ``outbox:email`` through the ``email-workers`` consumer group, so every message is handled by one
+    worker and stays pending until it is acknowledged. Failed messages wait in the ``outbox:email:retry`` sorted set
+    (scored by the time of the next attempt) with exponential backoff, and go to ``outbox:email:dead`` after
+    ``outbox_max_attempts`` attempts. Messages left pending by a crashed worker are claimed by the others.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = None
+        self._promote = None
+        if r is not None:
+            self.connect(r)
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._promote = r.register_script(PROMOTE_RETRIES)
+
+    async def enqueue(self, email: str, username: str, host: str) -> None:
+        """
+        Queue a verification email.
+
+        :param email: Email address to send message.
+        :type email: str
+        :param username: Username of the recipient.
+        :type username: str
+        :param host: Hostname of the recipient.
+        :type host: str
+        :return: None.
+        :rtype: None
+        :raises redis.RedisError: If the message could not be queued.
+        """
+        await self.r.xadd(OUTBOX_STREAM, {"email": email, "username": username, "host": host, "attempts": 0},
+                          maxlen=settings.outbox_max_len, approximate=True)
+
+    async def create_group(self) -> None:
+        """
+        Create the consumer group and the stream if they do not exist yet.
+
+        :return: None.
+        :rtype: None
+        """
+        try:
+            await self.r.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    async def promote_retries(self) -> int:
+        """
+        Move messages whose retry time has come back to the stream.
+
+        A Lua script adds each message to the stream before removing it from the retry set, so a message is
+        never lost and concurrent workers never duplicate it.
+
+        :return: The number of messages moved.
+        :rtype: int
+        """
+        return await self._promote(keys=[RETRY_KEY, OUTBOX_STREAM],
+                                   args=[time.time(), settings.outbox_batch_size, settings.outbox_max_len])
+
+    async def read(self, consumer: str, block: int = 5000) -> List[Tuple[str, dict]]:
+        """
+        Read a batch of messages: first those abandoned by other consumers, then new ones.
+
+        :param consumer: The name of this consumer.
+        :type consumer: str
+        :param block: How long to wait for new messages, in milliseconds.
+        :type block: int
+        :return: List of (message ID, fields) tuples.
+        :rtype: List[Tuple[str, dict]]
+        """
+        _, claimed, *_ = await self.r.xautoclaim(OUTBOX_STREAM, OUTBOX_GROUP, consumer,
+                                                  min_idle_time=settings.outbox_claim_idle * 1000,
+                                                  count=settings.outbox_batch_size)
+        if not claimed:
+            streams = await self.r.xreadgroup(OUTBOX_GROUP, consumer, {OUTBOX_STREAM: ">"},
+                                              count=settings.outbox_batch_size, block=block)
+            claimed = streams[0][1] if streams else []
+        return [(message_id, {key.decode(): value.decode() for key, value in fields.items()})
+                for message_id, fields in claimed if fields]
+
+    async def process(self, messages: List[Tuple[str, dict]], send: Callable[..., Awaitable[None]]) -> dict:
+        """
+        Send a batch of messages concurrently and acknowledge all of them. Malformed messages go straight to the
+        dead-letter stream.
+
+        :param messages: List of (message ID, fields) tuples.
+        :type messages: List[Tuple[str, dict]]
+        :param send: Coroutine function sending one email, called with email, username and host.
+        :type send: Callable[..., Awaitable[None]]
+        :return: Dict with the number of sent, retried and dead messages.
+        :rtype: dict
+        """
+        async def deliver(fields: dict) -> None:
+            if is_malformed(fields):
+                raise ValueError(f"Malformed outbox message: {fields}")
+            await send(fields["email"], fields["username"], fields["host"])
+
+        results = await asyncio.gather(*(deliver(fields) for _, fields in messages), return_exceptions=True)
+        counts = {"sent": 0, "retried": 0, "dead": 0}
+        async with self.r.pipeline(transaction=True) as pipe:
+            for (message_id, fields), result in zip(messages, results):
+                # CancelledError is not an Exception, but the email was not sent either
+                if not isinstance(result, BaseException):
+                    counts["sent"] += 1
+                else:
+                    print(result)
+                    if is_malformed(fields):
+                        attempts = settings.outbox_max_attempts
+                    else:
+                        attempts = int(fields.get("attempts", 0)) + 1
+                    if attempts >= settings.outbox_max_attempts:
+                        pipe.xadd(DEAD_LETTER_STREAM, {**fields, "attempts": attempts, "error": repr(result)},
+                                  maxlen=settings.outbox_max_len, approximate=True)
+                        counts["dead"] += 1
+                    else:
+                        member = encode_member(fields["email"], fields["username"], fields["host"], attempts)
+                        pipe.zadd(RETRY_KEY, {member: time.time() + retry_delay(attempts)})
+                        counts["retried"] += 1
+                pipe.xack(OUTBOX_STREAM, OUTBOX_GROUP, message_id)
+            await pipe.execute()
+        return counts
+
+    async def run(self, consumer: str, send: Callable[..., Awaitable[None]], stop: asyncio.Event) -> None:
+        """
+        Consume the outbox until ``stop`` is set.
+
+        :param consumer: The name of this consumer.
+        :type consumer: str
+        :param send: Coroutine function sending one email, called with email, username and host.
+        :type send: Callable[..., Awaitable[None]]
+        :param stop: Event that stops the worker after the current batch.
+        :type stop: asyncio.Event
+        :return: None.
+        :rtype: None
+        """
+        await self.create_group()
+        while not stop.is_set():
+            try:
+                await self.promote_retries()
+                messages = await self.read(consumer)
+                if messages:
+                    print(f"{consumer}: {await self.process(messages, send)}")
+            except redis.RedisError as err:
+                print(err)
+                await asyncio.sleep(1)
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff before the next attempt.
+
+    :param attempts: The number of failed attempts.
+    :type attempts: int
+    :return: Delay in seconds.
+    :rtype: float
+    """
+    return min(settings.outbox_retry_base * 2 ** (attempts - 1), settings.outbox_retry_max)
+
+
+def is_malformed(fields: dict) -> bool:
+    """
+    Whether a stream entry lacks a field needed to send the email or has an invalid attempt counter.
+    """
+    return any(not fields.get(field) for field in MESSAGE_FIELDS) or not str(fields.get("attempts", "0")).isdigit()
+
+
+def encode_member(email: str, username: str, host: str, attempts: int) -> str:
+    return "\0".join((email, username, host, str(attempts)))
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+email_outbox = EmailOutbox()
+
+
+async def main() -> None:
+    """
+    Run an email worker. Start with ``python -m src.services.outbox``; run more processes to send more emails.
+
+    :return: None.
+    :rtype: None
+    """
+    r = create_redis()
+    email_outbox.connect(r)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await email_outbox.run(f"{socket.gethostname()}-{os.getpid()}", send_email, stop)
+    finally:
+        await smtp_pool.close()
+        await r.aclose(close_connection_pool=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
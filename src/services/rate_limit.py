@@ -0,0 +1,186 @@
+import math
+import time
+from typing import Tuple
+
+import redis
+import redis.asyncio
+from jose import JWTError
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import TTLCache
+
+# path prefixes and their limit groups, the first match wins; paths without a group are not limited
+ROUTE_GROUPS = (
+    ("/api/health", None),
+    ("/api/auth", "auth"),
+    ("/api/contacts", "contacts"),
+    ("/api/users", "users"),
+    ("/api/batch", "batch"),
+    ("/api", "default"),
+)
+
+# KEYS: ratelimit:{group}:{subject}
+# ARGV: capacity, milliseconds to refill the whole bucket, now (ms), requested tokens
+# returns the granted tokens, the tokens left and the milliseconds until the next token if none were granted
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / period)
+local granted = math.min(tonumber(ARGV[4]), math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], period)
+local wait = 0
+if granted == 0 then
+    wait = math.ceil((1 - tokens) * period / capacity)
+end
+return {granted, math.floor(tokens), wait}
+"""
+
+
+def route_group(path: str) -> str | None:
+    """
+    Limit group of a request path.
+
+    :param path: The request path.
+    :type path: str
+    :return: The group name, or None if the path is not limited.
+    :rtype: str | None
+    """
+    for prefix, group in ROUTE_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return "default" if path == "/" else None
+
+
+class RateLimiter:
+    """
+    Token buckets per user and route group in Redis, with a local reservation in front of them.
+
+    ``ratelimit:{group}:{subject}`` is refilled continuously up to the capacity of the group. Instead of taking
+    one token per request, a worker takes a few at once and spends them locally, so most checks do not reach
+    Redis. Reserved tokens that are not spent within ``rate_limit_reserve_ttl`` are lost, which keeps the error
+    small and on the strict side.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = None
+        self._bucket = None
+        if r is not None:
+            self.connect(r)
+        self.local = TTLCache(maxsize=settings.rate_limit_local_size, ttl=settings.rate_limit_reserve_ttl)
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._bucket = r.register_script(TOKEN_BUCKET)
+
+    @staticmethod
+    def headers(capacity: int, period: int, remaining: int) -> dict:
+        """
+        Rate limit headers of a response.
+        """
+        return {"RateLimit-Limit": str(capacity), "RateLimit-Remaining": str(remaining),
+                "RateLimit-Reset": str(math.ceil((capacity - remaining) * period / capacity))}
+
+    async def acquire(self, group: str, subject: str) -> Tuple[bool, dict]:
+        """
+        Take a token for a request.
+
+        Requests are allowed without headers if Redis is unavailable.
+
+        :param group: The limit group of the route.
+        :type group: str
+        :param subject: The user or client the request is counted for.
+        :type subject: str
+        :return: Whether the request is allowed, and the headers to send with the response.
+        :rtype: Tuple[bool, dict]
+        """
+        capacity, period = settings.rate_limits[group]
+        key = f"ratelimit:{group}:{subject}"
+        reserved = self.local.get(key)
+        if reserved is not None and reserved[0] > 0:
+            reserved[0] -= 1
+            return True, self.headers(capacity, period, reserved[0] + reserved[1])
+        try:
+            granted, remaining, wait = await self._bucket(
+                keys=[key], args=[capacity, period * 1000, int(time.time() * 1000),
+                                  max(1, min(settings.rate_limit_reserve, capacity // 20))])
+        except redis.RedisError as err:
+            print(err)
+            return True, {}
+        if not granted:
+            headers = self.headers(capacity, period, 0)
+            headers["Retry-After"] = str(math.ceil(wait / 1000))
+            return False, headers
+        self.local.set(key, [granted - 1, remaining])
+        return True, self.headers(capacity, period, granted - 1 + remaining)
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+rate_limiter = RateLimiter()
+
+
+def request_subject(scope: Scope) -> str:
+    """
+    The user a request is counted for: the subject of a valid bearer token, otherwise the client IP.
+
+    Tokens are verified through the memoized :meth:`Auth.decode_token`, so no database access is needed.
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    return f"user:{auth_service.decode_token(token)['sub']}"
+                except (JWTError, KeyError):
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    Enforces the rate limits before a request reaches the routes and the database, and adds the
+    ``RateLimit-*`` headers to the response.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        group = route_group(scope["path"]) if scope["type"] == "http" else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+        allowed, headers = await rate_limiter.acquire(group, request_subject(scope))
+        if not allowed:
+            response = JSONResponse({"detail": "Too many requests"}, status_code=429, headers=headers)
+            await response(scope, receive, send)
+            return
+        if not headers:
+            await self.app(scope, receive, send)
+            return
+        raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + raw_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
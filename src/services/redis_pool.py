@@ -0,0 +1,81 @@
+import time
+
+import redis.asyncio
+from redis.asyncio.client import Pipeline
+
+from src.conf.config import settings
+from src.services.metrics import REDIS_LATENCY
+
+
+class InstrumentedPipeline(Pipeline):
+    """
+    Pipeline that records the latency of the whole round trip.
+    """
+
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.asyncio.Redis):
+    """
+    Redis client that records the latency of every command by command name.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def create_redis() -> redis.asyncio.Redis:
+    """
+    Creates the client of the application's Redis connection pool.
+
+    The pool holds at most ``redis_pool_size`` connections; when all are busy, a command waits up to
+    ``redis_pool_timeout`` seconds for one. Connections are opened on first use. Command latency is recorded
+    in the ``redis_command_duration_seconds`` histogram.
+
+    :return: The Redis client.
+    :rtype: redis.asyncio.Redis
+    """
+    pool = redis.asyncio.BlockingConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=0,
+        max_connections=settings.redis_pool_size,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+    )
+    return InstrumentedRedis(connection_pool=pool)
+
+
+def connect_services(r: redis.asyncio.Redis) -> None:
+    """
+    Points every Redis-backed service at the shared client.
+
+    :param r: The Redis client.
+    :type r: redis.asyncio.Redis
+    :return: None.
+    :rtype: None
+    """
+    from src.services.cache import user_cache, contacts_cache
+    from src.services.login_guard import login_guard
+    from src.services.outbox import email_outbox
+    from src.services.rate_limit import rate_limiter
+    from src.services.sessions import token_sessions
+    from src.services.suggest import contact_suggest
+
+    for service in (user_cache, contacts_cache, contact_suggest, email_outbox, token_sessions, login_guard,
+                    rate_limiter):
+        service.connect(r)
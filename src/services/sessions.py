@@ -0,0 +1,141 @@
+import redis
+import redis.asyncio
+
+# KEYS: session:{jti}, family:{family}, sessions:{email}:gen
+# ARGV: family, ttl, jti
+# stores a session with the current revocation generation of the user and makes it the current token of its family
+SESSION_CREATE = """
+local generation = redis.call('GET', KEYS[3]) or '0'
+redis.call('SET', KEYS[1], ARGV[1] .. ' ' .. generation, 'EX', ARGV[2])
+redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS: session:{jti}, family:{family}, sessions:{email}:gen, session:{new_jti}
+# ARGV: jti, new_jti, ttl
+# returns 1 if rotated, 0 if the session is unknown, expired or revoked, -1 if a rotated token was reused
+SESSION_ROTATE = """
+local current = redis.call('GET', KEYS[2])
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[2])
+    return -1
+end
+local session = redis.call('GET', KEYS[1])
+if not session then
+    return 0
+end
+local family, generation = string.match(session, '(%S+) (%S+)')
+if generation ~= (redis.call('GET', KEYS[3]) or '0') then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[4], family .. ' ' .. generation, 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+ROTATED = 1
+UNKNOWN = 0
+REUSED = -1
+
+
+class TokenSessions:
+    """
+    Refresh-token sessions in Redis.
+
+    ``session:{jti}`` holds the family and the revocation generation of a refresh token and expires with it.
+    A family is one login; ``family:{family}`` holds the ``jti`` of its only valid token. Refreshing rotates the
+    family to a new token, and presenting an already rotated token revokes the whole family. Incrementing
+    ``sessions:{email}:gen`` revokes every session of a user at once.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = None
+        self._create = None
+        self._rotate = None
+        if r is not None:
+            self.connect(r)
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._create = r.register_script(SESSION_CREATE)
+        self._rotate = r.register_script(SESSION_ROTATE)
+
+    async def create(self, email: str, jti: str, family: str, ttl: int) -> None:
+        """
+        Start a session for a new refresh token family.
+
+        :param email: The email of the user.
+        :type email: str
+        :param jti: The ID of the refresh token.
+        :type jti: str
+        :param family: The ID of the token family.
+        :type family: str
+        :param ttl: The lifetime of the refresh token in seconds.
+        :type ttl: int
+        :return: None.
+        :rtype: None
+        """
+        await self._create(keys=[f"session:{jti}", f"family:{family}", f"sessions:{email}:gen"],
+                           args=[family, ttl, jti])
+
+    async def rotate(self, email: str, jti: str, family: str, new_jti: str, ttl: int) -> int:
+        """
+        Replace the current token of a family with a new one.
+
+        :param email: The email of the user.
+        :type email: str
+        :param jti: The ID of the presented refresh token.
+        :type jti: str
+        :param family: The token family of the presented refresh token.
+        :type family: str
+        :param new_jti: The ID of the new refresh token.
+        :type new_jti: str
+        :param ttl: The lifetime of the new refresh token in seconds.
+        :type ttl: int
+        :return: ``ROTATED``, ``UNKNOWN`` if the session expired or was revoked, ``REUSED`` if the token was
+            already rotated; the family is revoked then.
+        :rtype: int
+        """
+        return await self._rotate(keys=[f"session:{jti}", f"family:{family}", f"sessions:{email}:gen",
+                                        f"session:{new_jti}"], args=[jti, new_jti, ttl])
+
+    async def revoke(self, jti: str, family: str) -> None:
+        """
+        End one session.
+
+        :param jti: The ID of the refresh token.
+        :type jti: str
+        :param family: The token family of the refresh token.
+        :type family: str
+        :return: None.
+        :rtype: None
+        """
+        await self.r.delete(f"session:{jti}", f"family:{family}")
+
+    async def revoke_all(self, email: str) -> None:
+        """
+        End every session of a user.
+
+        :param email: The email of the user.
+        :type email: str
+        :return: None.
+        :rtype: None
+        """
+        await self.r.incr(f"sessions:{email}:gen")
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+token_sessions = TokenSessions()
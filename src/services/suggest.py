@@ -0,0 +1,295 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+import redis
+import redis.asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import SessionLocal
+from src.database.models import Contact
+from src.services.redis_pool import create_redis
+
+REBUILD_BATCH_SIZE = 1000
+# changes made this long before a rebuild started are re-applied too, they may have been committed after it read
+REBUILD_OVERLAP = timedelta(minutes=1)
+
+# KEYS: suggest:{user_id}, suggest:{user_id}:ids
+# ARGV: pairs of contact id and member
+# replaces the previous member of each contact, so a concurrent update cannot leave a stale entry behind
+SUGGEST_ADD = """
+for i = 1, #ARGV, 2 do
+    local old = redis.call('HGET', KEYS[2], ARGV[i])
+    if old and old ~= ARGV[i + 1] then
+        redis.call('ZREM', KEYS[1], old)
+    end
+    redis.call('ZADD', KEYS[1], 0, ARGV[i + 1])
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS: suggest:{user_id}, suggest:{user_id}:ids
+# ARGV: contact ids
+SUGGEST_REMOVE = """
+for i = 1, #ARGV do
+    local old = redis.call('HGET', KEYS[2], ARGV[i])
+    if old then
+        redis.call('ZREM', KEYS[1], old)
+        redis.call('HDEL', KEYS[2], ARGV[i])
+    end
+end
+return 1
+"""
+
+# KEYS: temporary index, its ids hash, suggest:{user_id}, suggest:{user_id}:ids
+# the index is not replaced if the rebuild could not create it
+SUGGEST_REPLACE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[3])
+redis.call('RENAME', KEYS[2], KEYS[4])
+return 1
+"""
+
+
+def normalize(text: str) -> str:
+    """
+    Lower-cases a name and collapses whitespace, so lookups do not depend on case or spacing.
+
+    :param text: The text to normalize.
+    :type text: str
+    :return: The normalized text.
+    :rtype: str
+    """
+    return " ".join(text.casefold().split())
+
+
+class ContactSuggest:
+    """
+    Per-user autocomplete index of contact names in Redis.
+
+    ``suggest:{user_id}`` is a sorted set with score 0 whose members are ``normalized\\0label\\0id``, so
+    ZRANGEBYLEX answers prefix lookups. ``suggest:{user_id}:ids`` maps contact ids to their members
+    for updates and removals.
+    """
+
+    def __init__(self, r: redis.asyncio.Redis | None = None):
+        self.r = None
+        self._add = None
+        self._remove = None
+        self._replace = None
+        if r is not None:
+            self.connect(r)
+
+    def connect(self, r: redis.asyncio.Redis) -> None:
+        """
+        Use a Redis client, normally the one of the shared pool.
+
+        :param r: The Redis client.
+        :type r: redis.asyncio.Redis
+        :return: None.
+        :rtype: None
+        """
+        self.r = r
+        self._add = r.register_script(SUGGEST_ADD)
+        self._remove = r.register_script(SUGGEST_REMOVE)
+        self._replace = r.register_script(SUGGEST_REPLACE)
+
+    @staticmethod
+    def member(contact: Contact) -> str:
+        """
+        Sorted set member of a contact.
+        """
+        label = f"{contact.surname} {contact.name}"
+        return f"{normalize(label)}\0{label}\0{contact.id}"
+
+    async def add(self, contact: Contact) -> None:
+        """
+        Add a contact to the index of its user, replacing its previous entry.
+
+        :param contact: The contact to add.
+        :type contact: Contact
+        :return: None.
+        :rtype: None
+        """
+        await self.add_many(contact.user_id, [contact])
+
+    async def add_many(self, user_id: int, contacts: Iterable[Contact], key: str | None = None) -> None:
+        """
+        Add contacts of one user to the index with one round trip, replacing their previous entries.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param contacts: The contacts to add.
+        :type contacts: Iterable[Contact]
+        :param key: The index to add to. Default is the index of the user.
+        :type key: str, optional
+        :return: None.
+        :rtype: None
+        """
+        args = []
+        for contact in contacts:
+            args += [contact.id, self.member(contact)]
+        if not args:
+            return
+        key = key or f"suggest:{user_id}"
+        try:
+            await self._add(keys=[key, f"{key}:ids"], args=args)
+        except redis.RedisError as err:
+            print(err)
+
+    async def remove(self, contact: Contact) -> None:
+        """
+        Remove a contact from the index of its user.
+
+        :param contact: The contact to remove.
+        :type contact: Contact
+        :return: None.
+        :rtype: None
+        """
+        await self.remove_many(contact.user_id, [contact.id])
+
+    async def remove_many(self, user_id: int, contact_ids: List[int]) -> None:
+        """
+        Remove contacts of one user from the index with one round trip.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param contact_ids: The IDs of the contacts to remove.
+        :type contact_ids: List[int]
+        :return: None.
+        :rtype: None
+        """
+        if not contact_ids:
+            return
+        key = f"suggest:{user_id}"
+        try:
+            await self._remove(keys=[key, f"{key}:ids"], args=list(contact_ids))
+        except redis.RedisError as err:
+            print(err)
+
+    async def suggest(self, user_id: int, prefix: str, limit: int = 10) -> List[dict]:
+        """
+        Find contacts whose "surname name" starts with a prefix.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param prefix: The typed prefix.
+        :type prefix: str
+        :param limit: The maximum number of suggestions.
+        :type limit: int
+        :return: List of dicts with the contact id and label, empty if Redis is unavailable.
+        :rtype: List[dict]
+        """
+        start = normalize(prefix).encode()
+        try:
+            members = await self.r.zrangebylex(f"suggest:{user_id}", b"[" + start, b"[" + start + b"\xff", 0, limit)
+        except redis.RedisError as err:
+            print(err)
+            return []
+        suggestions = []
+        for member in members:
+            _, label, contact_id = member.decode().split("\0")
+            suggestions.append({"id": int(contact_id), "label": label})
+        return suggestions
+
+    async def indexed_ids(self, user_id: int) -> List[int]:
+        """
+        IDs of the contacts in the index of a user.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :return: The contact IDs, empty if Redis is unavailable.
+        :rtype: List[int]
+        """
+        try:
+            ids = await self.r.hkeys(f"suggest:{user_id}:ids")
+        except redis.RedisError as err:
+            print(err)
+            return []
+        return [int(contact_id) for contact_id in ids]
+
+    async def replace_index(self, user_id: int, key: str) -> bool:
+        """
+        Atomically put an index built under another key in place of the index of a user.
+
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param key: The key the new index was built under.
+        :type key: str
+        :return: Whether the index was replaced, False if the new index does not exist or Redis is unavailable.
+        :rtype: bool
+        """
+        try:
+            return bool(await self._replace(keys=[key, f"{key}:ids", f"suggest:{user_id}", f"suggest:{user_id}:ids"]))
+        except redis.RedisError as err:
+            print(err)
+            return False
+
+
+# connected to the shared Redis pool on startup, see src.services.redis_pool
+contact_suggest = ContactSuggest()
+
+
+async def catch_up(db: AsyncSession, user_id: int, since: datetime) -> None:
+    """
+    Re-apply changes to the contacts of a user made while the index was rebuilt, which went to the index the
+    rebuild replaced.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user_id: The ID of the user.
+    :type user_id: int
+    :param since: When the rebuild of the index started.
+    :type since: datetime
+    :return: None.
+    :rtype: None
+    """
+    # read before the database, so contacts added to the index meanwhile are already there
+    indexed = await contact_suggest.indexed_ids(user_id)
+    changed = await db.execute(select(Contact.id, Contact.name, Contact.surname, Contact.user_id)
+                               .filter(Contact.user_id == user_id, Contact.updated_at >= since))
+    await contact_suggest.add_many(user_id, changed.all())
+    existing = set((await db.execute(select(Contact.id).filter(Contact.user_id == user_id))).scalars().all())
+    await contact_suggest.remove_many(user_id, [contact_id for contact_id in indexed if contact_id not in existing])
+
+
+async def rebuild_all() -> None:
+    """
+    Rebuild the autocomplete index of every user from the database.
+
+    Each index is built under a temporary key and renamed into place, so suggestions keep working meanwhile.
+    Contacts changed or removed during the rebuild of an index are updated in it afterwards, see ``catch_up``.
+    An index that could not be built is left as it is.
+
+    Run with ``python -m src.services.suggest``.
+
+    :return: None.
+    :rtype: None
+    """
+    r = create_redis()
+    contact_suggest.connect(r)
+    async with SessionLocal() as db:
+        user_ids = (await db.execute(select(Contact.user_id).distinct())).scalars().all()
+        for user_id in user_ids:
+            key = f"suggest:{user_id}:rebuild"
+            started = datetime.now() - REBUILD_OVERLAP
+            await r.delete(key, f"{key}:ids")
+            stmt = (select(Contact.id, Contact.name, Contact.surname, Contact.user_id)
+                    .filter(Contact.user_id == user_id).execution_options(yield_per=REBUILD_BATCH_SIZE))
+            result = await db.stream(stmt)
+            async for rows in result.partitions():
+                await contact_suggest.add_many(user_id, rows, key=key)
+            if not await contact_suggest.replace_index(user_id, key):
+                print(f"Could not rebuild suggestions for user {user_id}")
+                continue
+            await catch_up(db, user_id, started)
+            print(f"Rebuilt suggestions for user {user_id}")
+    await r.aclose(close_connection_pool=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_all())
@@ -1,11 +1,16 @@
+from unittest.mock import AsyncMock
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.models import Base
-from src.database.db import get_db
+from src.database.db import get_engine, get_session_factory
+from src.services.rate_limit import rate_limiter
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -15,6 +20,24 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request in its own event loop, so async connections must not be pooled.
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+
+
+# pysqlite defers BEGIN and breaks SAVEPOINTs; let SQLAlchemy control the transactions instead,
+# so atomic batches roll back as they do on PostgreSQL.
+@event.listens_for(async_engine.sync_engine, "connect")
+def disable_driver_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(async_engine.sync_engine, "begin")
+def begin_transaction(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -32,19 +55,20 @@ def session():
 
 @pytest.fixture(scope="module")
 def client(session):
-    # Dependency override
-
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    # Dependency override: get_db opens its sessions from the session factory, atomic batches use the engine
 
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: AsyncTestingSessionLocal
+    app.dependency_overrides[get_engine] = lambda: async_engine
 
     yield TestClient(app)
 
 
 @pytest.fixture(scope="module")
 def user():
-    return {"username": "Roman", "email": "roman@example.com", "password": "123456789"}
\ No newline at end of file
+    return {"username": "Roman", "email": "roman@example.com", "password": "123456789"}
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    # route tests run without Redis; rate limiting has its own tests
+    monkeypatch.setattr(rate_limiter, "acquire", AsyncMock(return_value=(True, {})))
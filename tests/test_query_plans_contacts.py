@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+
+
+class TestContactsQueryPlans(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the contacts repository against a seeded database and checks that every statement
+    touching the contacts table is served by an index instead of a full table scan.
+    """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        self.statements = []
+
+        @event.listens_for(self.engine.sync_engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if "contacts" in statement and not statement.startswith("EXPLAIN") and not executemany:
+                self.statements.append((statement, parameters))
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        async with self.Session() as db:
+            users = [User(username=f"user{i}", email=f"user{i}@example.com", password="secret") for i in range(5)]
+            db.add_all(users)
+            await db.flush()
+            born = datetime(1990, 1, 1)
+            await db.execute(insert(Contact), [
+                dict(name=f"name{i}", surname=f"surname{i}", email=f"contact{i}@example.com", phone="+380683226263",
+                     born_date=born + timedelta(days=i), user_id=users[i % 5].id) for i in range(2000)])
+            await db.commit()
+            await db.execute(text("ANALYZE"))
+            self.user = users[0]
+        self.statements.clear()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def assert_indexed(self):
+        self.assertTrue(self.statements)
+        async with self.engine.connect() as conn:
+            for statement, parameters in self.statements:
+                plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+                for row in plan:
+                    detail = row[-1]
+                    if "contacts" in detail:
+                        self.assertTrue(detail.startswith("SEARCH"), f"{detail} for {statement}")
+
+    async def test_get_contacts(self):
+        async with self.Session() as db:
+            page = await repository_contacts.get_contacts(0, 50, self.user, db)
+            cursor = repository_contacts.encode_cursor(page[-1])
+            await repository_contacts.get_contacts(0, 50, self.user, db, cursor=cursor)
+            await repository_contacts.get_contacts(0, 50, self.user, db, name="name5")
+            await repository_contacts.get_contacts(0, 50, self.user, db, surname="surname5")
+            await repository_contacts.get_contacts(0, 50, self.user, db, email="contact5@example.com")
+            await repository_contacts.get_contacts(0, 50, self.user, db, name="name5", surname="surname5")
+            await repository_contacts.get_contacts(0, 50, self.user, db, q="surname1")
+        await self.assert_indexed()
+
+    async def test_get_contacts_version(self):
+        async with self.Session() as db:
+            updated_at, count = await repository_contacts.get_contacts_version(self.user, db)
+            await repository_contacts.get_contacts_version(self.user, db, name="name5")
+        self.assertEqual(count, 400)
+        self.assertIsNotNone(updated_at)
+        await self.assert_indexed()
+
+    async def test_get_contacts_bdays(self):
+        async with self.Session() as db:
+            week = await repository_contacts.get_contacts_bdays(self.user, db)
+            year = await repository_contacts.get_contacts_bdays(self.user, db, days=366)
+        self.assertTrue(week)
+        self.assertEqual(len(year), 400)
+        await self.assert_indexed()
+
+    async def test_get_contact(self):
+        async with self.Session() as db:
+            await repository_contacts.get_contact(5, self.user, db)
+        await self.assert_indexed()
+
+
+if __name__ == '__main__':
+    unittest.main()
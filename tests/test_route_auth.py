@@ -1,11 +1,23 @@
-from unittest.mock import MagicMock
+from unittest.mock import ANY, AsyncMock
+
+import pytest
+from fastapi import HTTPException
 
 from src.database.models import User
+from src.services.auth import auth_service
+from src.services.sessions import ROTATED, REUSED
+
+
+@pytest.fixture(autouse=True)
+def mock_login_guard(monkeypatch):
+    mock_guard = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.login_guard", mock_guard)
+    return mock_guard
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    mock_outbox = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.email_outbox", mock_outbox)
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -14,6 +26,7 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    mock_outbox.enqueue.assert_awaited_once_with(user["email"], user["username"], "http://testserver/")
 
 
 def test_repeat_create_user(client, user):
@@ -36,7 +49,9 @@ def test_login_user_not_confirmed(client, user):
     assert data["detail"] == "Email not confirmed"
 
 
-def test_login_user(client, session, user):
+def test_login_user(client, session, user, monkeypatch, mock_login_guard):
+    mock_sessions = AsyncMock()
+    monkeypatch.setattr("src.services.auth.token_sessions", mock_sessions)
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = True
     session.commit()
@@ -47,6 +62,39 @@ def test_login_user(client, session, user):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["token_type"] == "bearer"
+    mock_sessions.create.assert_awaited_once()
+    mock_login_guard.check.assert_awaited_once_with(ANY, user["email"])
+    mock_login_guard.reset.assert_awaited_once_with(user["email"])
+    user["refresh_token"] = data["refresh_token"]
+
+
+def test_refresh_token(client, user, monkeypatch):
+    mock_sessions = AsyncMock()
+    mock_sessions.rotate.return_value = ROTATED
+    monkeypatch.setattr("src.services.auth.token_sessions", mock_sessions)
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {user['refresh_token']}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["refresh_token"] != user["refresh_token"]
+    mock_sessions.rotate.assert_awaited_once()
+
+
+def test_refresh_token_reused(client, user, monkeypatch):
+    mock_sessions = AsyncMock()
+    mock_sessions.rotate.return_value = REUSED
+    monkeypatch.setattr("src.services.auth.token_sessions", mock_sessions)
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {user['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+
+
+def test_logout(client, user, monkeypatch):
+    mock_sessions = AsyncMock()
+    monkeypatch.setattr("src.services.auth.token_sessions", mock_sessions)
+    auth_service.rejected_tokens.clear()
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {user['refresh_token']}"})
+    assert response.status_code == 204, response.text
+    mock_sessions.revoke.assert_awaited_once()
 
 
 def test_login_wrong_password(client, user):
@@ -59,6 +107,20 @@ def test_login_wrong_password(client, user):
     assert data["detail"] == "Invalid password"
 
 
+def test_login_too_many_attempts(client, user, mock_login_guard, monkeypatch):
+    mock_verify = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.auth_service.verify_password", mock_verify)
+    mock_login_guard.check.side_effect = HTTPException(status_code=429, detail="Too many login attempts",
+                                                       headers={"Retry-After": "42"})
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": 'password'},
+    )
+    assert response.status_code == 429, response.text
+    assert response.headers["Retry-After"] == "42"
+    mock_verify.assert_not_awaited()
+
+
 def test_login_wrong_email(client, user):
     response = client.post(
         "/api/auth/login",
@@ -0,0 +1,109 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from main import app
+from src.database.models import User, Contact
+from src.services.auth import auth_service
+
+
+@pytest.fixture(scope="module")
+def current_user(client, session):
+    current_user = User(username="batch_user", email="batch@example.com", password="hash", confirmed=True)
+    session.add(current_user)
+    session.commit()
+    session.add_all([Contact(name=f"Batch{i}", surname="Contact", email=f"batch{i}@example.com",
+                             phone="+380683226263", born_date=datetime(1990, 1, 1), user_id=current_user.id)
+                     for i in range(3)])
+    session.commit()
+    app.dependency_overrides[auth_service.get_current_user] = lambda: current_user
+    cache = AsyncMock()
+    cache.get.return_value = (None, None)
+    with patch("src.repository.contacts.contact_suggest", AsyncMock()), \
+            patch("src.repository.contacts.contacts_cache", cache), patch("src.routes.contacts.contacts_cache", cache), \
+            patch("src.routes.batch.contacts_cache", cache):
+        yield current_user
+    del app.dependency_overrides[auth_service.get_current_user]
+
+
+def new_contact(name):
+    return {"name": name, "surname": "Batch", "email": f"{name.lower()}@example.com", "phone": "+380683226265",
+            "born_date": "1992-07-03T00:00:00"}
+
+
+def test_batch_reads(client, current_user):
+    response = client.post("/api/batch", json={"requests": [
+        {"method": "GET", "url": "/api/contacts/?limit=2"},
+        {"method": "GET", "url": "/api/contacts/bdays/?days=366"},
+        {"method": "GET", "url": "/api/contacts/999999"},
+    ]})
+    assert response.status_code == 200, response.text
+    contacts, bdays, missing = response.json()
+    assert contacts["status"] == 200
+    assert len(contacts["body"]) == 2
+    assert "etag" in contacts["headers"]
+    assert bdays["status"] == 200
+    assert missing["status"] == 404
+    assert missing["body"] == {"detail": "Contact not found"}
+
+
+def test_batch_writes(client, session, current_user):
+    response = client.post("/api/batch", json={"requests": [
+        {"method": "POST", "url": "/api/contacts/", "body": new_contact("Mykola")},
+        {"method": "POST", "url": "/api/contacts/", "body": {"name": "Invalid"}},
+        {"method": "POST", "url": "/api/contacts/", "body": new_contact("Oksana")},
+    ]})
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == [200, 422, 200]
+    assert session.query(Contact).filter(Contact.surname == "Batch").count() == 2
+
+
+def test_batch_atomic_rollback(client, session, current_user):
+    with patch("src.repository.contacts.contact_suggest", AsyncMock()) as mock_suggest, \
+            patch("src.repository.contacts.contacts_cache", AsyncMock()) as mock_cache:
+        response = client.post("/api/batch", json={"atomic": True, "requests": [
+            {"method": "POST", "url": "/api/contacts/", "body": new_contact("Petro")},
+            {"method": "DELETE", "url": "/api/contacts/999999"},
+            {"method": "GET", "url": "/api/contacts/"},
+        ]})
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == [200, 404, 424]
+    assert session.query(Contact).filter(Contact.name == "Petro").count() == 0
+    mock_suggest.add.assert_not_awaited()
+    # only the bump of the savepoint commit, none after the rolled back transaction
+    mock_cache.bump.assert_awaited_once_with(current_user.id)
+
+
+def test_batch_atomic_commit(client, session, current_user):
+    with patch("src.repository.contacts.contact_suggest", AsyncMock()) as mock_suggest, \
+            patch("src.repository.contacts.contacts_cache", AsyncMock()) as mock_cache:
+        response = client.post("/api/batch", json={"atomic": True, "requests": [
+            {"method": "POST", "url": "/api/contacts/", "body": new_contact("Stepan")},
+            {"method": "POST", "url": "/api/contacts/", "body": new_contact("Vira")},
+        ]})
+    assert [result["status"] for result in response.json()] == [200, 200]
+    assert session.query(Contact).filter(Contact.name.in_(["Stepan", "Vira"])).count() == 2
+    assert [call.args[0].name for call in mock_suggest.add.await_args_list] == ["Stepan", "Vira"]
+    # bumped on every savepoint commit and again after the transaction committed
+    assert mock_cache.bump.await_count == 4
+
+
+def test_batch_nested(client, current_user):
+    response = client.post("/api/batch", json={"requests": [{"method": "POST", "url": "/api/batch"}]})
+    assert response.json()[0]["status"] == 400
+
+
+def test_batch_rate_limited(client, current_user, monkeypatch):
+    mock_acquire = AsyncMock(side_effect=[(True, {}), (False, {"Retry-After": "3"}), (True, {})])
+    monkeypatch.setattr("src.services.batch.rate_limiter.acquire", mock_acquire)
+    response = client.post("/api/batch", json={"requests": [
+        {"method": "GET", "url": "/api/contacts/"},
+        {"method": "GET", "url": "/api/contacts/bdays/"},
+    ]})
+    assert response.status_code == 200, response.text
+    limited, allowed = response.json()
+    assert limited["status"] == 429
+    assert limited["headers"] == {"Retry-After": "3"}
+    assert allowed["status"] == 200
+    assert [call.args[0] for call in mock_acquire.await_args_list] == ["batch", "contacts", "contacts"]
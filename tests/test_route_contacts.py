@@ -0,0 +1,189 @@
+import json
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from main import app
+from src.database.models import User, Contact
+from src.services.auth import auth_service
+
+
+@pytest.fixture(scope="module")
+def current_user(client, session, user):
+    current_user = User(username=user["username"], email=user["email"], password="hash", confirmed=True)
+    session.add(current_user)
+    session.commit()
+    app.dependency_overrides[auth_service.get_current_user] = lambda: current_user
+    cache = AsyncMock()
+    cache.get.return_value = (None, None)
+    with patch("src.repository.contacts.contact_suggest", AsyncMock()), \
+            patch("src.repository.contacts.contacts_cache", cache), patch("src.routes.contacts.contacts_cache", cache):
+        yield current_user
+    del app.dependency_overrides[auth_service.get_current_user]
+
+
+def test_import_contacts_csv(client, session, current_user):
+    data = ("name,surname,email,phone,born_date\n"
+            "Ivan,Petrenko,ivan@example.com,+380683226263,1990-05-01\n"
+            "Olena,Shevchenko,not-an-email,+380683226264,1991-06-02\n")
+    response = client.post("/api/contacts/import", files={"file": ("contacts.csv", data, "text/csv")})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 3
+    assert session.query(Contact).filter(Contact.email == "ivan@example.com").count() == 1
+
+
+def test_import_contacts_ndjson(client, current_user):
+    lines = [json.dumps({"name": "Taras", "surname": "Bondar", "email": "taras@example.com", "phone": "+380683226265",
+                         "born_date": "1992-07-03"}), "{broken", ""]
+    response = client.post("/api/contacts/import", files={"file": ("contacts.ndjson", "\n".join(lines))})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["errors"][0]["row"] == 2
+
+
+def test_import_contacts_unknown_format(client, current_user):
+    response = client.post("/api/contacts/import", files={"file": ("contacts.txt", "data", "text/plain")})
+    assert response.status_code == 415, response.text
+
+
+def test_export_contacts(client, current_user):
+    response = client.get("/api/contacts/export")
+    assert response.status_code == 200, response.text
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["email"] for row in rows] == ["ivan@example.com", "taras@example.com"]
+
+
+def test_export_contacts_csv(client, current_user):
+    response = client.get("/api/contacts/export", params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "name,surname,email,phone,born_date"
+    assert len(lines) == 3
+
+
+def test_export_contacts_vcard(client, current_user):
+    response = client.get("/api/contacts/export", params={"format": "vcard"})
+    assert response.status_code == 200, response.text
+    assert response.text.count("BEGIN:VCARD") == 2
+    assert "N:Petrenko;Ivan;;;" in response.text
+
+
+def test_search_contacts(client, current_user):
+    response = client.get("/api/contacts/", params={"q": "TAR"})
+    assert response.status_code == 200, response.text
+    assert [contact["name"] for contact in response.json()] == ["Taras"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_search_contacts_substring(client, current_user):
+    response = client.get("/api/contacts/", params={"q": "en"})
+    assert response.status_code == 200, response.text
+    assert [contact["name"] for contact in response.json()] == ["Ivan"]
+    response = client.get("/api/contacts/", params={"q": "%"})
+    assert response.json() == []
+
+
+def test_combined_filters(client, current_user):
+    response = client.get("/api/contacts/", params={"name": "Ivan", "surname": "Bondar"})
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+
+def test_suggest_contacts(client, current_user):
+    suggestions = [{"id": 1, "label": "Petrenko Ivan"}]
+    with patch("src.routes.contacts.contact_suggest.suggest", AsyncMock(return_value=suggestions)) as mock_suggest:
+        response = client.get("/api/contacts/suggest", params={"prefix": "pet"})
+    assert response.status_code == 200, response.text
+    assert response.json() == suggestions
+    mock_suggest.assert_awaited_once_with(current_user.id, "pet", 10)
+
+
+def test_read_contacts_cached(client, current_user):
+    body, headers = b'[{"cached": true}]', {"X-Next-Cursor": "abc"}
+    with patch("src.routes.contacts.contacts_cache.get", AsyncMock(return_value=(b"1", (body, headers)))):
+        response = client.get("/api/contacts/")
+    assert response.status_code == 200, response.text
+    assert response.content == body
+    assert response.headers["X-Next-Cursor"] == "abc"
+
+
+def test_read_contacts_not_modified(client, current_user):
+    response = client.get("/api/contacts/", params={"q": "Petrenko"})
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+    response = client.get("/api/contacts/", params={"q": "Petrenko"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_read_contacts_etag_changes(client, current_user):
+    etag = client.get("/api/contacts/").headers["ETag"]
+    contact = {"name": "Taras", "surname": "Bondar", "email": "taras@example.com", "phone": "+380683226265",
+               "born_date": "1992-07-03T00:00:00"}
+    assert client.post("/api/contacts/", json=contact).status_code == 200
+    response = client.get("/api/contacts/", headers={"If-None-Match": etag})
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"] != etag
+
+
+def test_read_contact_not_modified(client, session, current_user):
+    contact_id = session.query(Contact.id).filter(Contact.user_id == current_user.id).first().id
+    etag = client.get(f"/api/contacts/{contact_id}").headers["ETag"]
+    response = client.get(f"/api/contacts/{contact_id}", headers={"If-None-Match": f'W/"x", {etag}'})
+    assert response.status_code == 304
+
+
+def test_read_contacts_cached_not_modified(client, current_user):
+    body, headers = b'[{"cached": true}]', {"ETag": '"abc"'}
+    with patch("src.routes.contacts.contacts_cache.get", AsyncMock(return_value=(b"1", (body, headers)))):
+        response = client.get("/api/contacts/", headers={"If-None-Match": '"abc"'})
+    assert response.status_code == 304
+
+
+def add_contacts(session, user, count):
+    contacts = [Contact(name=f"Batch{i}", surname="Contact", email=f"batch{i}@example.com", phone="+380683226263",
+                        born_date=datetime(1990, 1, 1), user_id=user.id) for i in range(count)]
+    session.add_all(contacts)
+    session.commit()
+    return [contact.id for contact in contacts]
+
+
+def test_batch_delete(client, session, current_user):
+    ids = add_contacts(session, current_user, 3)
+    response = client.post("/api/contacts/batch-delete", json={"ids": ids + [999999]})
+    assert response.status_code == 200, response.text
+    assert response.json() == [{"id": contact_id, "status": "deleted"} for contact_id in ids] + \
+        [{"id": 999999, "status": "not_found"}]
+    session.expire_all()
+    assert session.query(Contact).filter(Contact.id.in_(ids)).count() == 0
+
+
+def test_batch_update(client, session, current_user):
+    ids = add_contacts(session, current_user, 2)
+    items = [{"id": ids[0], "name": "Renamed"}, {"id": ids[1], "born_date": "1991-02-03T00:00:00"},
+             {"id": 999999, "name": "Nobody"}]
+    response = client.patch("/api/contacts/batch", json={"items": items})
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == ["updated", "updated", "not_found"]
+    session.expire_all()
+    first, second = session.query(Contact).filter(Contact.id.in_(ids)).order_by(Contact.id).all()
+    assert (first.name, first.surname) == ("Renamed", "Contact")
+    assert (second.name, second.born_date, second.bday_key) == ("Batch1", datetime(1991, 2, 3), 203)
+
+
+def test_batch_delete_other_user(client, session, current_user):
+    other = User(username="other_user", email="other@example.com", password="hash", confirmed=True)
+    session.add(other)
+    session.commit()
+    ids = add_contacts(session, other, 1)
+    response = client.post("/api/contacts/batch-delete", json={"ids": ids})
+    assert response.json() == [{"id": ids[0], "status": "not_found"}]
+    session.expire_all()
+    assert session.get(Contact, ids[0]) is not None
@@ -0,0 +1,50 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, literal, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services.metrics import TimedSession, instrument_engine
+
+
+def test_metrics(client):
+    response = client.get("/api/health")
+    assert response.status_code == 200, response.text
+    client.get("/api/contacts/1/missing-route")
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/health"}' in body
+    assert 'http_requests_total{method="GET",route="/api/health",status="200"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert 'cache_hits_total{cache="user_local"}' in body
+    assert 'http_requests_in_progress{route="/metrics"} 1.0' in body
+    assert 'http_requests_in_progress{route="/api/health"} 0.0' in body
+
+
+def test_instrument_engine():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert REGISTRY.get_sample_value("db_pool_connections_in_use") >= 1
+    engine.dispose()
+
+
+def test_timed_session():
+    def count(operation):
+        return REGISTRY.get_sample_value("db_query_duration_seconds_count", {"operation": operation}) or 0
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with TimedSession(engine) as db:
+            await db.execute(text("SELECT 1"))
+            await db.execute(select(literal(1)))
+            await db.commit()
+        await engine.dispose()
+
+    before = {operation: count(operation) for operation in ("SELECT", "OTHER", "COMMIT")}
+    asyncio.run(run())
+    assert count("SELECT") == before["SELECT"] + 1
+    assert count("OTHER") == before["OTHER"] + 1
+    assert count("COMMIT") == before["COMMIT"] + 1
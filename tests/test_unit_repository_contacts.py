@@ -1,96 +1,187 @@
 import unittest
-from unittest.mock import MagicMock
-from datetime import datetime, timedelta
+from collections import namedtuple
+from unittest.mock import MagicMock, AsyncMock, patch
+from datetime import date, datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Insert, Update, Delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import os
 import sys
 sys.path.append(os.path.abspath('../HW_M11'))
 
 from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.schemas import ContactModel, ContactPatch
 from src.repository.contacts import (
     get_contacts,
+    encode_cursor,
+    decode_cursor,
     get_contact,
     create_contact,
     update_contact,
     remove_contact,
+    update_contacts,
+    remove_contacts,
     get_contacts_bdays)
 
+ContactRow = namedtuple("ContactRow", "id name surname user_id")
+
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.session.info = {}
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
+        patcher = patch("src.repository.contacts.contact_suggest", AsyncMock())
+        self.suggest = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("src.repository.contacts.contacts_cache", AsyncMock())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact(), Contact()]
 
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_cursor(self):
+        contacts = [Contact(id=11), Contact(id=12)]
+        self.result.scalars().all.return_value = contacts
+        cursor = encode_cursor(Contact(id=10))
+        result = await get_contacts(skip=0, limit=2, user=self.user, db=self.session, cursor=cursor)
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIsNone(stmt._offset_clause)
+        self.assertEqual(decode_cursor(cursor), 10)
+
+    async def test_get_contacts_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            await get_contacts(skip=0, limit=2, user=self.user, db=self.session, cursor="not-a-cursor")
+
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    def assert_single_statement(self, kind):
+        self.session.execute.assert_awaited_once()
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIsInstance(stmt, kind)
+        self.assertTrue(stmt._returning)
+        self.session.refresh.assert_not_awaited()
+        self.session.delete.assert_not_called()
+
     async def test_create_contact(self):
         body = ContactModel(name="<NAME>", surname="<SURNAME>", email="0953226763r@gmail.com", phone="+380683226263",
                             born_date="2022-08-08")
+        contact = Contact(id=1, user_id=self.user.id, **body.model_dump())
+        self.result.scalar_one.return_value = contact
         result = await create_contact(body=body, user=self.user, db=self.session)
-        self.assertEqual(result.name, body.name)
-        self.assertEqual(result.surname, body.surname)
-        self.assertEqual(result.email, body.email)
-        self.assertEqual(result.phone, body.phone)
-        self.assertEqual(result.born_date, body.born_date)
-        self.assertTrue(hasattr(result, "id"))
+        self.assertEqual(result, contact)
+        self.assert_single_statement(Insert)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual(params["name"], body.name)
+        self.assertEqual(params["user_id"], self.user.id)
+        self.suggest.add.assert_awaited_once_with(result)
+        self.cache.bump.assert_awaited_once_with(self.user.id)
 
     async def test_update_contact_found(self):
         body = ContactModel(name="<NAME1>", surname="<SURNAME1>", email="0953226763r@gmail.com", phone="+380683226263",
                             born_date="2022-08-08")
-        contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        contact = Contact(id=1, user_id=self.user.id)
+        self.result.scalar_one_or_none.return_value = contact
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        self.assert_single_statement(Update)
+        self.assertEqual(self.session.execute.call_args.args[0].compile().params["bday_key"], 808)
+        self.suggest.add.assert_awaited_once_with(contact)
+        self.cache.bump.assert_awaited_once_with(contact.user_id)
 
     async def test_update_contact_not_found(self):
         body = ContactModel(name="<NAME1>", surname="<SURNAME1>", email="0953226763r@gmail.com", phone="+380683226263",
                             born_date="2022-08-08")
-        self.session.query().filter().first.return_value = None
-        self.session.commit.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.assert_single_statement(Update)
+        self.cache.bump.assert_not_awaited()
 
     async def test_remove_contact_found(self):
-        contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        contact = Contact(id=1, user_id=self.user.id)
+        self.result.scalar_one_or_none.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        self.assert_single_statement(Delete)
+        self.suggest.remove.assert_awaited_once_with(contact)
+        self.cache.bump.assert_awaited_once_with(contact.user_id)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.assert_single_statement(Delete)
+        self.cache.bump.assert_not_awaited()
+
+    async def test_remove_contacts(self):
+        self.result.scalars().all.return_value = [1, 3]
+        result = await remove_contacts(contact_ids=[1, 2, 3], user=self.user, db=self.session)
+        self.assertEqual(result, [1, 3])
+        self.assert_single_statement(Delete)
+        self.suggest.remove_many.assert_awaited_once_with(self.user.id, [1, 3])
+        self.cache.bump.assert_awaited_once_with(self.user.id)
+
+    async def test_update_contacts(self):
+        owned = MagicMock()
+        owned.all.return_value = [ContactRow(id=1, name="Ivan", surname="Petrenko", user_id=1)]
+        self.session.execute.side_effect = [owned, MagicMock()]
+        patches = [ContactPatch(id=1, surname="Shevchenko", born_date="1990-05-01"), ContactPatch(id=2, name="X")]
+        result = await update_contacts(patches=patches, user=self.user, db=self.session)
+        self.assertEqual(result, [1])
+        self.assertEqual(self.session.execute.await_count, 2)
+        rows = self.session.execute.call_args.args[1]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["id"], rows[0]["surname"], rows[0]["bday_key"]), (1, "Shevchenko", 501))
+        self.assertNotIn("name", rows[0])
+        renamed = self.suggest.add_many.call_args.args[1]
+        self.assertEqual((renamed[0].name, renamed[0].surname), ("Ivan", "Shevchenko"))
+
+    async def test_update_contacts_none_owned(self):
+        self.result.all.return_value = []
+        result = await update_contacts(patches=[ContactPatch(id=2, name="X")], user=self.user, db=self.session)
+        self.assertEqual(result, [])
+        self.session.execute.assert_awaited_once()
+        self.cache.bump.assert_not_awaited()
 
     async def test_get_contacts_bdays(self):
         today = datetime.now()
         tomorrow = today + timedelta(days=1)
         str_date = tomorrow.strftime("%Y-%m-%d")
         contact = Contact(born_date=str_date)
-        self.session.query().filter().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contacts_bdays(user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
+    async def test_get_contacts_bdays_year_wrap(self):
+        self.result.scalars().all.return_value = []
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2024, 12, 29)
+            await get_contacts_bdays(user=self.user, db=self.session, days=7)
+        stmt = self.session.execute.call_args.args[0]
+        params = stmt.compile().params
+        self.assertIn(1229, params.values())
+        self.assertIn(105, params.values())
+        self.assertIn(" OR ", str(stmt))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import os
 import sys
@@ -17,17 +17,19 @@ from src.repository.users import (
 
 class TestUsers(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
 
     async def test_get_user_by_email_found(self):
         user = User(email="0953226763r@gmail.com")
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_email(email="0953226763r@gmail.com", db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_user_by_email(email="0953226763r@gmail.com", db=self.session)
         self.assertIsNone(None)
 
@@ -41,7 +43,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_avatar(self):
         user = User(avatar="avatar.com")
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await update_avatar(email="0953226763r@gmail.com", url="avatar.com", db=self.session)
         self.assertEqual(result, user)
 
@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.services.auth import Auth
+
+
+class TestAuthTokenCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.verified_tokens.clear()
+        self.auth.rejected_tokens.clear()
+        self.session = MagicMock(spec=AsyncSession)
+        self.request = MagicMock(scope={})
+
+    async def test_decode_token_memoized(self):
+        token = await self.auth.create_access_token(data={"sub": "roman@example.com"})
+        hits = self.auth.token_cache_stats()["verified"]["hits"]
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as mock_decode:
+            first = self.auth.decode_token(token)
+            second = self.auth.decode_token(token)
+        self.assertEqual(first, second)
+        self.assertEqual(mock_decode.call_count, 1)
+        self.assertEqual(self.auth.token_cache_stats()["verified"]["hits"] - hits, 1)
+
+    async def test_decode_token_rejected(self):
+        with patch("src.services.auth.jwt.decode", side_effect=JWTError) as mock_decode:
+            with self.assertRaises(JWTError):
+                self.auth.decode_token("invalid")
+            with self.assertRaises(JWTError):
+                self.auth.decode_token("invalid")
+        self.assertEqual(mock_decode.call_count, 1)
+
+    async def test_get_current_user_deleted(self):
+        token = await self.auth.create_access_token(data={"sub": "deleted@example.com"})
+        with patch("src.services.auth.user_cache", AsyncMock()) as mock_cache, \
+                patch("src.services.auth.repository_users.get_user_by_email", return_value=None) as mock_get:
+            mock_cache.get.return_value = None
+            for _ in range(2):
+                with self.assertRaises(HTTPException):
+                    await self.auth.get_current_user(self.request, token, self.session)
+        self.assertEqual(mock_get.call_count, 1)
+
+    async def test_refresh_token_as_access_token(self):
+        with patch("src.services.auth.token_sessions", AsyncMock()):
+            token = await self.auth.create_refresh_token(data={"sub": "roman@example.com"})
+        with self.assertRaises(HTTPException):
+            await self.auth.get_current_user(self.request, token, self.session)
+        self.assertEqual(self.auth.decode_refresh_claims(token)["sub"], "roman@example.com")
+
+    async def test_get_current_user_batch(self):
+        user = MagicMock()
+        self.request.scope["batch"] = {"user": user, "db": self.session}
+        with patch("src.services.auth.jwt.decode") as mock_decode:
+            self.assertIs(await self.auth.get_current_user(self.request, "token", self.session), user)
+        mock_decode.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
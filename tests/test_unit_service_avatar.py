@@ -0,0 +1,97 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services.avatar import AvatarService, LocalStorage, UploadSizeLimitMiddleware, make_thumbnails, read_upload
+
+
+def make_image(width: int, height: int, fmt: str = "PNG") -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, format=fmt)
+    return out.getvalue()
+
+
+class TestAvatar(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.storage = LocalStorage(self.tmp.name, "/static/avatars/")
+
+    async def test_read_upload(self):
+        data = make_image(10, 10)
+        self.assertEqual(await read_upload(UploadFile(io.BytesIO(data)), len(data)), data)
+
+    async def test_read_upload_too_large(self):
+        with self.assertRaises(HTTPException) as cm:
+            await read_upload(UploadFile(io.BytesIO(b"x" * 200_000)), 100_000)
+        self.assertEqual(cm.exception.status_code, 413)
+
+    def test_make_thumbnails(self):
+        thumbnails = make_thumbnails(make_image(800, 600), (250, 64))
+        for size, data in thumbnails.items():
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format, "JPEG")
+                self.assertEqual(image.size, (size, size))
+
+    def test_make_thumbnails_invalid(self):
+        with self.assertRaises(ValueError):
+            make_thumbnails(b"not an image")
+
+    async def test_local_storage(self):
+        url = await self.storage.save("roman_64", b"jpeg")
+        self.assertTrue(url.startswith("/static/avatars/roman_64.jpg?v="))
+        self.assertEqual((Path(self.tmp.name) / "roman_64.jpg").read_bytes(), b"jpeg")
+
+    async def test_local_storage_outside_root(self):
+        with self.assertRaises(ValueError):
+            await self.storage.save("../../escape_250", b"jpeg")
+        self.assertFalse((Path(self.tmp.name).parent.parent / "escape_250.jpg").exists())
+
+    async def test_update(self):
+        service = AvatarService(self.storage, sizes=(250, 64))
+        url = await service.update(7, UploadFile(io.BytesIO(make_image(1200, 900, "JPEG"))))
+        self.assertTrue(url.startswith("/static/avatars/7_250.jpg"))
+        self.assertTrue((Path(self.tmp.name) / "7_64.jpg").exists())
+
+    async def test_update_not_an_image(self):
+        service = AvatarService(self.storage)
+        with self.assertRaises(HTTPException) as cm:
+            await service.update(7, UploadFile(io.BytesIO(b"<html></html>")))
+        self.assertEqual(cm.exception.status_code, 422)
+
+
+
+class TestUploadSizeLimit(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(UploadSizeLimitMiddleware, limits={"/upload": 1000})
+
+        @app.post("/upload")
+        async def upload(file: UploadFile = File()):
+            return {"size": len(await file.read())}
+
+        self.client = TestClient(app)
+
+    def test_within_limit(self):
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 100)})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json(), {"size": 100})
+
+    def test_content_length_over_limit(self):
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 5000)})
+        self.assertEqual(response.status_code, 413, response.text)
+
+    def test_streamed_body_over_limit(self):
+        body = (b"x" * 500 for _ in range(10))
+        response = self.client.post("/upload", content=body,
+                                    headers={"Content-Type": "multipart/form-data; boundary=b"})
+        self.assertEqual(response.status_code, 413, response.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
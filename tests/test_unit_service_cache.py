@@ -0,0 +1,189 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from datetime import datetime
+
+import orjson
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src.database.db import PENDING_AFTER_COMMIT
+from src.database.models import Base, User
+import redis
+
+from src.services.cache import (TTLCache, UserCache, ResponseCache, encode_user, decode_user, user_cache,
+                                USER_INVALIDATION_CHANNEL)
+
+
+class TestUserCacheRecord(unittest.TestCase):
+    def setUp(self):
+        self.user = User(id=1, username="Roman", email="roman@example.com", password="hash",
+                         created_at=datetime(2024, 3, 5, 12, 0), updated_at=datetime(2024, 3, 6, 8, 30, 0, 125),
+                         confirmed=True, avatar="avatar.com")
+
+    def test_round_trip(self):
+        result = decode_user(encode_user(self.user))
+        self.assertEqual(result.id, self.user.id)
+        self.assertEqual(result.email, self.user.email)
+        self.assertEqual(result.created_at, self.user.created_at)
+        self.assertEqual(result.updated_at, self.user.updated_at)
+        self.assertTrue(result.confirmed)
+
+    def test_secrets_not_cached(self):
+        data = encode_user(self.user)
+        self.assertNotIn(b"hash", data)
+        self.assertNotIn(b"token", data)
+
+    def test_other_version(self):
+        record = orjson.loads(encode_user(self.user))
+        record["v"] += 1
+        self.assertIsNone(decode_user(orjson.dumps(record)))
+
+    def test_malformed(self):
+        self.assertIsNone(decode_user(b"\x80\x04not json"))
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_expired(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=-1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+
+class TestUserInvalidation(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = Session(engine)
+        self.user = User(username="Roman", email="roman@example.com", password="hash")
+        self.db.add(self.user)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_cached_field_changed(self):
+        with patch.object(user_cache, "invalidate") as mock_invalidate:
+            self.user.confirmed = True
+            self.db.commit()
+        mock_invalidate.assert_called_once_with("roman@example.com")
+
+    def test_other_field_changed(self):
+        with patch.object(user_cache, "invalidate") as mock_invalidate:
+            self.user.password = "new hash"
+            self.db.commit()
+        mock_invalidate.assert_not_called()
+
+    def test_deleted(self):
+        with patch.object(user_cache, "invalidate") as mock_invalidate:
+            self.db.delete(self.user)
+            self.db.commit()
+        mock_invalidate.assert_called_once_with("roman@example.com")
+
+    def test_rolled_back(self):
+        with patch.object(user_cache, "invalidate") as mock_invalidate:
+            self.user.confirmed = True
+            self.db.flush()
+            self.db.rollback()
+            self.db.commit()
+        mock_invalidate.assert_not_called()
+
+    def test_atomic_batch(self):
+        pending = self.db.info[PENDING_AFTER_COMMIT] = []
+        with patch.object(user_cache, "invalidate") as mock_invalidate:
+            self.user.confirmed = True
+            self.db.commit()
+            mock_invalidate.assert_not_called()
+            for operation, args in pending:
+                asyncio.run(operation(*args))
+        mock_invalidate.assert_called_once_with("roman@example.com")
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=None)
+        self.cache = UserCache(self.redis)
+        self.user = User(id=1, username="Roman", email="roman@example.com", confirmed=True)
+
+    async def test_set_and_get(self):
+        self.redis.set = AsyncMock()
+        await self.cache.set(self.user)
+        key, data = self.redis.set.call_args.args
+        self.assertEqual(key, "user:roman@example.com")
+        self.cache.local.clear()
+        self.redis.get = AsyncMock(return_value=data)
+        self.assertEqual((await self.cache.get("roman@example.com")).id, 1)
+        # served from the local cache the second time
+        self.assertEqual((await self.cache.get("roman@example.com")).id, 1)
+        self.redis.get.assert_awaited_once()
+
+    async def test_get_redis_unavailable(self):
+        self.redis.get = AsyncMock(side_effect=redis.ConnectionError)
+        self.assertIsNone(await self.cache.get("roman@example.com"))
+
+    async def test_invalidate(self):
+        self.cache.local.set("roman@example.com", self.user)
+        self.cache.invalidate("roman@example.com")
+        self.assertIsNone(self.cache.local.get("roman@example.com"))
+        await asyncio.gather(*self.cache._pending)
+        self.pipe.delete.assert_called_once_with("user:roman@example.com")
+        self.pipe.publish.assert_called_once_with(USER_INVALIDATION_CHANNEL, "roman@example.com")
+        self.pipe.execute.assert_awaited_once()
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.redis.register_script.return_value = AsyncMock()
+        self.redis.set = AsyncMock()
+        self.redis.incr = AsyncMock()
+        self.cache = ResponseCache(self.redis, prefix="contacts", ttl=60)
+
+    async def test_get_miss(self):
+        self.cache._get.return_value = [b"3", None]
+        generation, cached = await self.cache.get(1, "list")
+        self.assertEqual(generation, b"3")
+        self.assertIsNone(cached)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    async def test_set_and_get(self):
+        await self.cache.set(1, b"3", "list", b"[]", {"X-Next-Cursor": "abc"})
+        key, entry = self.redis.set.call_args.args
+        self.assertEqual(key, f"contacts:1:3:{ResponseCache.digest('list')}")
+        self.assertEqual(self.redis.set.call_args.kwargs, {"ex": 60})
+        self.cache._get.return_value = [b"3", entry]
+        generation, cached = await self.cache.get(1, "list")
+        self.assertEqual(cached, (b"[]", {"X-Next-Cursor": "abc"}))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    async def test_set_without_generation(self):
+        await self.cache.set(1, None, "list", b"[]")
+        self.redis.set.assert_not_awaited()
+
+    async def test_bump(self):
+        await self.cache.bump(1)
+        self.redis.incr.assert_awaited_once_with("contacts:1:gen")
+
+
+if __name__ == '__main__':
+    unittest.main()
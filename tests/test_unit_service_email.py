@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from email.message import EmailMessage
+
+from aiosmtpd.controller import Controller
+from aiosmtplib import SMTPException
+
+from src.services.email import SMTPPool, verification_message
+
+PORT = 8025
+
+
+class Collector:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def make_message(i: int) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = f"Message {i}"
+    message["From"] = "sender@example.com"
+    message["To"] = f"user{i}@example.com"
+    message.set_content("Hello")
+    return message
+
+
+class TestSMTPPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.handler = Collector()
+        # the server drops connections idle for longer than a second
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=PORT, server_kwargs={"timeout": 1})
+        self.controller.start()
+        self.addCleanup(self.controller.stop)
+        self.pool = SMTPPool("127.0.0.1", PORT, use_tls=False, size=2, keepalive=60)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_connections_reused(self):
+        await asyncio.gather(*(self.pool.send(make_message(i)) for i in range(6)))
+        self.assertEqual(len(self.handler.messages), 6)
+        self.assertLessEqual(self.pool.connections, 2)
+        self.assertEqual(self.pool.stats()["sent"], 6)
+
+    async def test_reconnect_after_disconnect(self):
+        await self.pool.send(make_message(0))
+        await asyncio.sleep(1.5)
+        await self.pool.send(make_message(1))
+        self.assertEqual(len(self.handler.messages), 2)
+        self.assertEqual(self.pool.connections, 2)
+        self.assertEqual(self.pool.failed, 0)
+
+    async def test_server_down(self):
+        pool = SMTPPool("127.0.0.1", PORT + 1, use_tls=False)
+        with self.assertRaises((SMTPException, OSError)):
+            await pool.send(make_message(0))
+        self.assertEqual(pool.failed, 1)
+
+    def test_verification_message(self):
+        message = verification_message("roman@example.com", "Roman", "http://localhost/")
+        self.assertEqual(message["To"], "roman@example.com")
+        self.assertIn("Hi Roman", message.get_content())
+        self.assertIn("http://localhost/api/auth/confirmed_email/", message.get_content())
+
+
+if __name__ == '__main__':
+    unittest.main()
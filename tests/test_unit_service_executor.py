@@ -0,0 +1,31 @@
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.executor import CpuExecutor
+
+
+class TestCpuExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.executor = CpuExecutor(max_workers=2, max_queue=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_run(self):
+        result = await self.executor.run(pow, 2, 10)
+        self.assertEqual(result, 1024)
+        stats = self.executor.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["queued"], 0)
+
+    async def test_run_queue_full(self):
+        self.executor.queued = 2
+        with self.assertRaises(HTTPException) as cm:
+            await self.executor.run(pow, 2, 10)
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
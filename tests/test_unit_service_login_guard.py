@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import redis
+from fastapi import HTTPException
+
+from src.services.login_guard import LoginGuard
+
+
+class TestLoginGuard(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.gate = AsyncMock(return_value=0)
+        self.redis.register_script.return_value = self.gate
+        self.guard = LoginGuard(self.redis)
+
+    async def test_allowed(self):
+        with patch("src.services.login_guard.time.time", return_value=1000.0):
+            await self.guard.check("10.0.0.1", "Roman@Example.com")
+        kwargs = self.gate.call_args.kwargs
+        self.assertEqual(kwargs["keys"], ["login:ip:10.0.0.1", "login:account:roman@example.com"])
+        self.assertEqual(kwargs["args"][0], 1000000)
+        self.assertEqual(kwargs["args"][2:], [20, 60000, 10, 900000])
+
+    async def test_rejected(self):
+        self.gate.return_value = 41200
+        with self.assertRaises(HTTPException) as cm:
+            await self.guard.check("10.0.0.1", "roman@example.com")
+        self.assertEqual(cm.exception.status_code, 429)
+        self.assertEqual(cm.exception.headers["Retry-After"], "42")
+
+    async def test_redis_unavailable(self):
+        self.gate.side_effect = redis.ConnectionError("down")
+        await self.guard.check("10.0.0.1", "roman@example.com")
+
+    async def test_reset(self):
+        self.redis.delete = AsyncMock()
+        await self.guard.reset("Roman@example.com")
+        self.redis.delete.assert_awaited_once_with("login:account:roman@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
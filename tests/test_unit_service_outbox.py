@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.services.outbox import (EmailOutbox, OUTBOX_STREAM, OUTBOX_GROUP, RETRY_KEY, DEAD_LETTER_STREAM, retry_delay,
+                                 encode_member)
+
+
+class TestEmailOutbox(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.promote = AsyncMock(return_value=1)
+        self.redis.register_script.return_value = self.promote
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=None)
+        self.outbox = EmailOutbox(self.redis)
+
+    async def test_enqueue(self):
+        self.redis.xadd = AsyncMock()
+        await self.outbox.enqueue("roman@example.com", "Roman", "http://localhost/")
+        self.assertEqual(self.redis.xadd.call_args.args, (OUTBOX_STREAM, {
+            "email": "roman@example.com", "username": "Roman", "host": "http://localhost/", "attempts": 0}))
+
+    async def test_process(self):
+        messages = [
+            ("1-0", {"email": "ok@example.com", "username": "Ok", "host": "h", "attempts": "0"}),
+            ("2-0", {"email": "retry@example.com", "username": "Retry", "host": "h", "attempts": "1"}),
+            ("3-0", {"email": "dead@example.com", "username": "Dead", "host": "h", "attempts": "4"}),
+        ]
+
+        async def send(email, username, host):
+            if email != "ok@example.com":
+                raise OSError("connection refused")
+
+        with patch("src.services.outbox.time.time", return_value=1000.0):
+            counts = await self.outbox.process(messages, send)
+        self.assertEqual(counts, {"sent": 1, "retried": 1, "dead": 1})
+        self.pipe.zadd.assert_called_once_with(
+            RETRY_KEY, {encode_member("retry@example.com", "Retry", "h", 2): 1000.0 + retry_delay(2)})
+        self.assertEqual(self.pipe.xadd.call_args.args[0], DEAD_LETTER_STREAM)
+        self.assertEqual(self.pipe.xadd.call_args.args[1]["attempts"], 5)
+        self.assertEqual([call.args for call in self.pipe.xack.call_args_list],
+                         [(OUTBOX_STREAM, OUTBOX_GROUP, message_id) for message_id in ("1-0", "2-0", "3-0")])
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_promote_retries(self):
+        with patch("src.services.outbox.time.time", return_value=1000.0):
+            self.assertEqual(await self.outbox.promote_retries(), 1)
+        self.promote.assert_awaited_once_with(keys=[RETRY_KEY, OUTBOX_STREAM], args=[1000.0, 50, 100000])
+
+    async def test_process_cancelled(self):
+        async def send(email, username, host):
+            raise asyncio.CancelledError()
+
+        counts = await self.outbox.process([("1-0", {"email": "a@example.com", "username": "A", "host": "h",
+                                                     "attempts": "0"})], send)
+        self.assertEqual(counts, {"sent": 0, "retried": 1, "dead": 0})
+        self.pipe.zadd.assert_called_once()
+
+    async def test_process_malformed(self):
+        send = AsyncMock()
+        counts = await self.outbox.process([("1-0", {"username": "A", "host": "h", "attempts": "0"}),
+                                            ("2-0", {"email": "b@example.com", "username": "B", "host": "h",
+                                                     "attempts": "x"})], send)
+        self.assertEqual(counts, {"sent": 0, "retried": 0, "dead": 2})
+        send.assert_not_awaited()
+        self.assertEqual(self.pipe.xack.call_count, 2)
+
+    async def test_read_claims_abandoned_first(self):
+        self.redis.xautoclaim = AsyncMock(return_value=[b"0-0", [(b"1-0", {b"email": b"a@example.com"})], []])
+        self.redis.xreadgroup = AsyncMock()
+        self.assertEqual(await self.outbox.read("worker"), [(b"1-0", {"email": "a@example.com"})])
+        self.redis.xreadgroup.assert_not_awaited()
+
+    async def test_read_new(self):
+        self.redis.xautoclaim = AsyncMock(return_value=[b"0-0", [], []])
+        self.redis.xreadgroup = AsyncMock(return_value=[[OUTBOX_STREAM, [(b"2-0", {b"email": b"b@example.com"})]]])
+        self.assertEqual(await self.outbox.read("worker"), [(b"2-0", {"email": "b@example.com"})])
+
+    def test_retry_delay(self):
+        with patch("src.services.outbox.settings") as mock_settings:
+            mock_settings.outbox_retry_base = 30
+            mock_settings.outbox_retry_max = 100
+            self.assertEqual([retry_delay(attempts) for attempts in (1, 2, 3)], [30, 60, 100])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import redis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services.auth import auth_service
+from src.services.rate_limit import RateLimiter, RateLimitMiddleware, route_group, request_subject
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.bucket = AsyncMock(return_value=[10, 290, 0])
+        self.redis.register_script.return_value = self.bucket
+        self.limiter = RateLimiter(self.redis)
+
+    async def test_local_reservation(self):
+        with patch("src.services.rate_limit.time.time", return_value=1000.0):
+            results = [await self.limiter.acquire("contacts", "user:roman@example.com") for _ in range(10)]
+        self.assertTrue(all(allowed for allowed, _ in results))
+        self.bucket.assert_awaited_once_with(keys=["ratelimit:contacts:user:roman@example.com"],
+                                             args=[300, 60000, 1000000, 10])
+        self.assertEqual(results[0][1]["RateLimit-Remaining"], "299")
+        self.assertEqual(results[-1][1]["RateLimit-Remaining"], "290")
+        await self.limiter.acquire("contacts", "user:roman@example.com")
+        self.assertEqual(self.bucket.await_count, 2)
+
+    async def test_rejected(self):
+        self.bucket.return_value = [0, 0, 1500]
+        allowed, headers = await self.limiter.acquire("auth", "ip:10.0.0.1")
+        self.assertFalse(allowed)
+        self.assertEqual(headers["Retry-After"], "2")
+        self.assertEqual(headers["RateLimit-Remaining"], "0")
+        self.assertEqual(headers["RateLimit-Reset"], "60")
+
+    async def test_redis_unavailable(self):
+        self.bucket.side_effect = redis.ConnectionError("down")
+        self.assertEqual(await self.limiter.acquire("auth", "ip:10.0.0.1"), (True, {}))
+
+    def test_route_group(self):
+        self.assertEqual(route_group("/api/contacts/5"), "contacts")
+        self.assertEqual(route_group("/api/auth/login"), "auth")
+        self.assertEqual(route_group("/"), "default")
+        self.assertIsNone(route_group("/api/health"))
+        self.assertIsNone(route_group("/docs"))
+
+    async def test_request_subject(self):
+        token = await auth_service.create_access_token(data={"sub": "roman@example.com"})
+        scope = {"headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("10.0.0.1", 1234)}
+        self.assertEqual(request_subject(scope), "user:roman@example.com")
+        scope["headers"] = [(b"authorization", b"Bearer invalid")]
+        self.assertEqual(request_subject(scope), "ip:10.0.0.1")
+
+
+class TestRateLimitMiddleware(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(RateLimitMiddleware)
+        app.get("/api/contacts/")(lambda: [])
+        app.get("/api/health")(lambda: {})
+        self.client = TestClient(app)
+
+    def test_allowed(self):
+        headers = {"RateLimit-Limit": "300", "RateLimit-Remaining": "299", "RateLimit-Reset": "1"}
+        with patch("src.services.rate_limit.rate_limiter.acquire", AsyncMock(return_value=(True, headers))):
+            response = self.client.get("/api/contacts/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["RateLimit-Remaining"], "299")
+
+    def test_rejected(self):
+        headers = {"RateLimit-Limit": "300", "RateLimit-Remaining": "0", "RateLimit-Reset": "60", "Retry-After": "1"}
+        with patch("src.services.rate_limit.rate_limiter.acquire", AsyncMock(return_value=(False, headers))):
+            response = self.client.get("/api/contacts/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+    def test_not_limited(self):
+        with patch("src.services.rate_limit.rate_limiter.acquire", AsyncMock()) as mock_acquire:
+            response = self.client.get("/api/health")
+        self.assertEqual(response.status_code, 200)
+        mock_acquire.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
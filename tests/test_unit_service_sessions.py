@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import redis
+from fastapi import HTTPException
+
+from src.services.auth import Auth
+from src.services.sessions import TokenSessions, ROTATED, UNKNOWN, REUSED
+
+
+class TestTokenSessions(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.create, self.rotate = AsyncMock(), AsyncMock(return_value=ROTATED)
+        self.redis.register_script.side_effect = [self.create, self.rotate]
+        self.sessions = TokenSessions(self.redis)
+
+    async def test_create(self):
+        await self.sessions.create("roman@example.com", "jti", "fam", 60)
+        self.create.assert_awaited_once_with(keys=["session:jti", "family:fam", "sessions:roman@example.com:gen"],
+                                             args=["fam", 60, "jti"])
+
+    async def test_rotate(self):
+        result = await self.sessions.rotate("roman@example.com", "jti", "fam", "new", 60)
+        self.assertEqual(result, ROTATED)
+        self.rotate.assert_awaited_once_with(
+            keys=["session:jti", "family:fam", "sessions:roman@example.com:gen", "session:new"],
+            args=["jti", "new", 60])
+
+    async def test_revoke_all(self):
+        self.redis.incr = AsyncMock()
+        await self.sessions.revoke_all("roman@example.com")
+        self.redis.incr.assert_awaited_once_with("sessions:roman@example.com:gen")
+
+
+class TestAuthRefreshRotation(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.auth = Auth()
+        self.auth.verified_tokens.clear()
+        self.auth.rejected_tokens.clear()
+        patcher = patch("src.services.auth.token_sessions", AsyncMock())
+        self.sessions = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.token = await self.auth.create_refresh_token(data={"sub": "roman@example.com"})
+
+    async def test_create_starts_family(self):
+        claims = self.auth.decode_refresh_claims(self.token)
+        self.sessions.create.assert_awaited_once_with("roman@example.com", claims["jti"], claims["fam"], 604800)
+        other = self.auth.decode_refresh_claims(await self.auth.create_refresh_token(data={"sub": "roman@example.com"}))
+        self.assertNotEqual(claims["fam"], other["fam"])
+
+    async def test_rotate(self):
+        self.sessions.rotate.return_value = ROTATED
+        email, token = await self.auth.rotate_refresh_token(self.token)
+        old, new = self.auth.decode_refresh_claims(self.token), self.auth.decode_refresh_claims(token)
+        self.assertEqual(email, "roman@example.com")
+        self.assertEqual(new["fam"], old["fam"])
+        self.assertNotEqual(new["jti"], old["jti"])
+        self.sessions.rotate.assert_awaited_once_with("roman@example.com", old["jti"], old["fam"], new["jti"], 604800)
+
+    async def test_rotate_rejected(self):
+        for result in (UNKNOWN, REUSED):
+            self.auth.rejected_tokens.clear()
+            self.sessions.rotate.return_value = result
+            with self.assertRaises(HTTPException) as cm:
+                await self.auth.rotate_refresh_token(self.token)
+            self.assertEqual(cm.exception.status_code, 401)
+
+    async def test_rotate_store_unavailable(self):
+        self.sessions.rotate.side_effect = redis.ConnectionError("down")
+        with self.assertRaises(HTTPException) as cm:
+            await self.auth.rotate_refresh_token(self.token)
+        self.assertEqual(cm.exception.status_code, 503)
+
+    async def test_rotate_access_token(self):
+        token = await self.auth.create_access_token(data={"sub": "roman@example.com"})
+        with self.assertRaises(HTTPException) as cm:
+            await self.auth.rotate_refresh_token(token)
+        self.assertEqual(cm.exception.status_code, 401)
+        self.sessions.rotate.assert_not_awaited()
+
+    async def test_revoke(self):
+        claims = self.auth.decode_refresh_claims(self.token)
+        await self.auth.revoke_refresh_token(self.token)
+        self.sessions.revoke.assert_awaited_once_with(claims["jti"], claims["fam"])
+        with self.assertRaises(HTTPException):
+            self.auth.decode_refresh_claims(self.token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import redis
+
+from src.database.models import Contact
+from src.services.suggest import ContactSuggest, catch_up, normalize
+
+
+class TestContactSuggest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.add, self.remove, self.replace = AsyncMock(), AsyncMock(), AsyncMock()
+        self.redis.register_script.side_effect = [self.add, self.remove, self.replace]
+        self.suggest = ContactSuggest(self.redis)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Petrenko   IVAN "), "petrenko ivan")
+
+    def test_member(self):
+        contact = Contact(id=7, name="Ivan", surname="Petrenko", user_id=1)
+        self.assertEqual(ContactSuggest.member(contact), "petrenko ivan\0Petrenko Ivan\x007")
+
+    async def test_suggest(self):
+        self.redis.zrangebylex = AsyncMock(return_value=[b"petrenko ivan\0Petrenko Ivan\x007"])
+        result = await self.suggest.suggest(1, "Pet", 5)
+        self.assertEqual(result, [{"id": 7, "label": "Petrenko Ivan"}])
+        self.redis.zrangebylex.assert_awaited_once_with("suggest:1", b"[pet", b"[pet\xff", 0, 5)
+
+    async def test_suggest_redis_unavailable(self):
+        self.redis.zrangebylex = AsyncMock(side_effect=redis.ConnectionError("down"))
+        self.assertEqual(await self.suggest.suggest(1, "Pet", 5), [])
+
+    async def test_add(self):
+        await self.suggest.add(Contact(id=7, name="Ivan", surname="Petrenko", user_id=1))
+        self.add.assert_awaited_once_with(keys=["suggest:1", "suggest:1:ids"],
+                                          args=[7, "petrenko ivan\0Petrenko Ivan\x007"])
+
+    async def test_remove_many(self):
+        await self.suggest.remove_many(1, [7, 8])
+        self.remove.assert_awaited_once_with(keys=["suggest:1", "suggest:1:ids"], args=[7, 8])
+
+    async def test_replace_index(self):
+        self.replace.return_value = 1
+        self.assertTrue(await self.suggest.replace_index(1, "suggest:1:rebuild"))
+        self.replace.assert_awaited_once_with(keys=["suggest:1:rebuild", "suggest:1:rebuild:ids", "suggest:1",
+                                                    "suggest:1:ids"])
+
+    async def test_replace_index_not_built(self):
+        self.replace.return_value = 0
+        self.assertFalse(await self.suggest.replace_index(1, "suggest:1:rebuild"))
+
+    async def test_catch_up(self):
+        self.redis.hkeys = AsyncMock(return_value=[b"7", b"8"])
+        changed = Contact(id=9, name="Olena", surname="Shevchenko", user_id=1)
+        db = MagicMock(execute=AsyncMock(side_effect=[MagicMock(all=MagicMock(return_value=[changed])),
+                                                      MagicMock(scalars=MagicMock(return_value=MagicMock(
+                                                          all=MagicMock(return_value=[7, 9]))))]))
+        with patch("src.services.suggest.contact_suggest", self.suggest):
+            await catch_up(db, 1, datetime(2024, 3, 1))
+        self.add.assert_awaited_once_with(keys=["suggest:1", "suggest:1:ids"],
+                                          args=[9, "shevchenko olena\0Shevchenko Olena\x009"])
+        self.remove.assert_awaited_once_with(keys=["suggest:1", "suggest:1:ids"], args=[8])
+
+
+if __name__ == '__main__':
+    unittest.main()